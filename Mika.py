@@ -1,3 +1,5 @@
+import time
+STARTED_AT = time.perf_counter()  # bench-startup measures import time from here
 import discord
 from discord.ext import commands
 import logging
@@ -5,70 +7,781 @@ from dotenv import load_dotenv
 import os
 import random
 import aiohttp
-import aiofiles
+import yarl
 import asyncio
-from bs4 import BeautifulSoup
+import importlib
+import importlib.util
 import json
 import re
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, namedtuple, deque
 import urllib.parse
 import base64
 import io
-from rapidfuzz import process, fuzz
+import types
 import atexit
+import subprocess
+import sys
+import threading
+import sqlite3
+import heapq
+import itertools
+import bisect
+import hashlib
+import gzip
+from xml.etree import ElementTree
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+# Optional packages are only looked up here, importing them is left to LazyModule below (bs4 pulls in lxml itself)
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+HAS_PIL = importlib.util.find_spec("PIL") is not None
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+# bs4, rapidfuzz, aiofiles, PIL ושאר הכבדים נטענים רק כשמשהו באמת משתמש בהם, ככה הבוט עולה מהר יותר אחרי דיפלוי
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+bs4 = LazyModule("bs4")
+process = LazyModule("rapidfuzz.process")
+fuzz = LazyModule("rapidfuzz.fuzz")
+aiofiles = LazyModule("aiofiles")
+Image = LazyModule("PIL.Image")
+numpy = LazyModule("numpy")  # rapidfuzz's cdist hands back numpy arrays
+web = LazyModule("aiohttp.web")  # only the metrics endpoint serves anything
+tracemalloc = LazyModule("tracemalloc")  # only bench-parse
+LAZY_MODULES = [bs4, process, fuzz, aiofiles, web, tracemalloc]
+if HAS_PIL:
+    LAZY_MODULES.append(Image)
+if HAS_NUMPY:
+    LAZY_MODULES.append(numpy)
+
+def load_lazy_modules():
+    for module in LAZY_MODULES:
+        module.load()
 
 # ======= Setup and Globals =======
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
+OWNER_ID = 338054995209355274
 DISCOGS_TOKEN = os.getenv("DISCOGS_TOKEN")
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
+# Base URLs can be pointed at a local stub server for offline load testing
+DISCOGS_API = os.getenv("DISCOGS_API", "https://api.discogs.com")
+SPOTIFY_API = os.getenv("SPOTIFY_API", "https://api.spotify.com")
+SPOTIFY_ACCOUNTS_API = os.getenv("SPOTIFY_ACCOUNTS_API", "https://accounts.spotify.com")
+STEAM_STORE_API = os.getenv("STEAM_STORE_API", "https://store.steampowered.com")
+# Discord too, tests/test_clusters.py runs whole clusters against the gateway stub in bench/stubs.py
+DISCORD_API = os.getenv("DISCORD_API")
+DISCORD_GATEWAY = os.getenv("DISCORD_GATEWAY")
 REVIEW_JSON_PATH = "curator_reviews.json"
-
-handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
+REVIEW_STORE_PATH = "curator_reviews.jsonl"
+HTTP_CACHE_PATH = os.getenv("HTTP_CACHE_PATH", "http_cache.sqlite3")
+THEOREM_PATH = "geo-list.txt"
+STREAK_SNAPSHOT_PATH = os.getenv("STREAK_SNAPSHOT_PATH", "streaks.sqlite3")
+METRICS_PATH = os.getenv("METRICS_PATH", "metrics.prom")
+METRICS_PORT = os.getenv("METRICS_PORT")
+LOG_PATH = "discord.log"
+# Sharding: CLUSTER_COUNT > 1 turns `python Mika.py` into a launcher that starts one process per cluster,
+# each one gets its own SHARD_IDS. Cluster 0 is the leader and the only one that scrapes and syncs
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = os.getenv("SHARD_IDS")
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", 1))
+CLUSTER_ID = int(os.getenv("CLUSTER_ID", 0))
+IS_LEADER = CLUSTER_ID == 0
+SHARED_STATE_POLL = int(os.getenv("SHARED_STATE_POLL", 30))
+if CLUSTER_COUNT > 1:
+    root, ext = os.path.splitext(METRICS_PATH)
+    METRICS_PATH = f"{root}.{CLUSTER_ID}{ext}"
+    if METRICS_PORT:
+        METRICS_PORT = str(int(METRICS_PORT) + CLUSTER_ID)
+    LOG_PATH = f"discord.{CLUSTER_ID}.log"
+WARMUP_SNAPSHOT_PATH = os.getenv("WARMUP_SNAPSHOT_PATH", "warmup_snapshot.json")
+DISCOGS_INDEX_PATH = os.getenv("DISCOGS_INDEX_PATH", "discogs_index.sqlite3")
+ARTIST_DICT_PATH = os.getenv("ARTIST_DICT_PATH", "artists.jsonl")
+MEDIA_LINKS_PATH = os.getenv("MEDIA_LINKS_PATH", "media_links.json")
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "media_cache")
+MEDIA_MANIFEST_PATH = os.path.join(MEDIA_CACHE_DIR, "manifest.json")
+MEDIA_DIRS = os.getenv("MEDIA_DIRS", "./Sosa,.").split(",")
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+MEDIA_CACHE_MAX_FILE_BYTES = int(os.getenv("MEDIA_CACHE_MAX_FILE_BYTES", 2 * 1024 * 1024))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", 4))
+# HTML parsing is CPU bound and holds the GIL, so it gets real processes by default. WORKER_PROCESSES=0 keeps it in threads
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", min(2, os.cpu_count() or 1)))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.25))
+LOOP_LAG_WARN = float(os.getenv("LOOP_LAG_WARN", 0.1))
+# LAZY_IMPORTS=0 brings back the old eager imports (bench-startup compares the two)
+LAZY_IMPORTS = os.getenv("LAZY_IMPORTS", "1") != "0"
+if not LAZY_IMPORTS:
+    load_lazy_modules()
+
+handler = logging.FileHandler(filename=LOG_PATH, encoding='utf-8', mode='w', delay=True)
 logging.basicConfig(level=logging.WARNING, handlers=[handler])
 
+if DISCORD_API:
+    discord.http.Route.BASE = DISCORD_API
+if DISCORD_GATEWAY:
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(DISCORD_GATEWAY)
+
 intents = discord.Intents.default()
 intents.messages = True
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix='h2a ', intents=intents, help_command=None)
+shard_options = {}
+if SHARD_COUNT or SHARD_IDS:
+    shard_options = {
+        "shard_count": int(SHARD_COUNT) if SHARD_COUNT else None,
+        "shard_ids": [int(s) for s in SHARD_IDS.split(",")] if SHARD_IDS else None
+    }
+
+class MikaBot(commands.AutoShardedBot if shard_options else commands.Bot):
+    async def setup_hook(self):
+        # Runs before the gateway connects, so the files are usually loaded by the time on_ready fires
+        start_preloads()
+
+    async def close(self):
+        # The HTTP session lives on the bot's loop, so it's closed here while that loop is still running
+        try:
+            await super().close()
+        finally:
+            await close_http_session()
+
+bot = MikaBot(command_prefix='h2a ', intents=intents, help_command=None, **shard_options)
 
 aiohttp_session = None
-message_streaks = defaultdict(lambda: {"last_user": None, "count": 0})
 
 # ======= Preload Data =======
+# נטען ברקע מ-setup_hook ולא בזמן ה-import, הפקודות שצריכות את זה מחכות ל-preload_task אם הוא עוד רץ
 sosa_folder = "./Sosa"
-sosa_files = [os.path.join(sosa_folder, f) for f in os.listdir(sosa_folder)
-              if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]
-
+SOSA_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+sosa_files = []
 berman_sentences = []
-try:
-    with open("berman.txt", "r", encoding="utf-8") as f:
-        berman_sentences = f.read().splitlines()
-except Exception:
-    pass
+preload_task = None
+
+def list_sosa_files():
+    return [os.path.join(sosa_folder, f) for f in os.listdir(sosa_folder)
+            if f.lower().endswith(SOSA_EXTENSIONS)]
+
+async def load_sosa_files():
+    global sosa_files
+    try:
+        files = await run_in_worker("thread", list_sosa_files)
+    except OSError:
+        logging.warning("Could not list %s", sosa_folder)
+        return
+    # The media manifest may have filled the list already, and it knows about optimized variants
+    if not sosa_files:
+        sosa_files = files
+
+async def load_berman_sentences():
+    global berman_sentences
+    try:
+        async with aiofiles.open("berman.txt", "r", encoding="utf-8") as f:
+            berman_sentences = (await f.read()).splitlines()
+    except Exception:
+        pass
 
 gacha_games = []
 fish_list = []
-curator_reviews = []
 
 
+# ======= Metrics =======
+# היסטוגרמות עם באקטים קבועים, כל מדידה זה bisect ושלוש הוספות אז זה לא מרגיש בהודעות
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_DUMP_INTERVAL = 30
+metrics_histograms = {}  # (kind, name) -> [count, total seconds, per-bucket counts]
+metrics_counters = defaultdict(int)  # (event, label) -> count
+metrics_task = None
+
+def metrics_observe(kind, name, seconds):
+    hist = metrics_histograms.get((kind, name))
+    if hist is None:
+        hist = metrics_histograms[(kind, name)] = [0, 0.0, [0] * (len(METRIC_BUCKETS) + 1)]
+    hist[0] += 1
+    hist[1] += seconds
+    hist[2][bisect.bisect_left(METRIC_BUCKETS, seconds)] += 1
+
+def metrics_inc(event, label=""):
+    metrics_counters[(event, label)] += 1
+
+def metrics_quantile(hist, q):
+    # Upper bound of the bucket the quantile falls in, which is as precise as a bucketed histogram gets
+    target = hist[0] * q
+    seen = 0
+    for bound, n in zip(METRIC_BUCKETS + (float("inf"),), hist[2]):
+        seen += n
+        if seen >= target:
+            return bound
+    return float("inf")
+
+def prom_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def metrics_text():
+    lines = ["# TYPE mika_latency_seconds histogram"]
+    for (kind, name), (count, total, buckets) in sorted(metrics_histograms.items()):
+        labels = f'kind="{prom_label(kind)}",name="{prom_label(name)}"'
+        cumulative = 0
+        for bound, n in zip(METRIC_BUCKETS, buckets):
+            cumulative += n
+            lines.append(f'mika_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'mika_latency_seconds_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"mika_latency_seconds_sum{{{labels}}} {total}")
+        lines.append(f"mika_latency_seconds_count{{{labels}}} {count}")
+    lines.append("# TYPE mika_events_total counter")
+    for (event, label), n in sorted(metrics_counters.items()):
+        lines.append(f'mika_events_total{{event="{prom_label(event)}",label="{prom_label(label)}"}} {n}')
+    lines.append("# TYPE mika_media_cache_total counter")
+    for result, n in media_cache_stats.items():
+        lines.append(f'mika_media_cache_total{{result="{result}"}} {n}')
+    lines.append("# TYPE mika_http_in_flight gauge")
+    for host, n in sorted(http_in_flight.items()):
+        lines.append(f'mika_http_in_flight{{host="{prom_label(host)}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+def write_metrics_file():
+    tmp_path = METRICS_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(metrics_text())
+    os.replace(tmp_path, METRICS_PATH)
+
+async def serve_metrics(request):
+    return web.Response(text=metrics_text(), content_type="text/plain")
+
+async def run_metrics_exporter():
+    if METRICS_PORT:
+        app = web.Application()
+        app.router.add_get("/metrics", serve_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", int(METRICS_PORT)).start()
+    while True:
+        await asyncio.sleep(METRICS_DUMP_INTERVAL)
+        try:
+            await asyncio.to_thread(write_metrics_file)
+        except Exception:
+            logging.exception("Writing metrics failed")
+
+def http_endpoint(url):
+    # Numeric and Spotify-style IDs are folded so every album doesn't get its own series
+    path = re.sub(r"/(?:\d+|[A-Za-z0-9]{16,})(?=/|$)", "/{id}", url.path)
+    return f"{url.host}{path}"
+
+async def on_http_request_start(session, trace_ctx, params):
+    trace_ctx.start = time.perf_counter()
+    trace_ctx.host = params.url.host
+    http_in_flight[trace_ctx.host] += 1
+
+async def on_http_request_end(session, trace_ctx, params):
+    http_in_flight[trace_ctx.host] -= 1
+    endpoint = http_endpoint(params.url)
+    metrics_observe("http", endpoint, time.perf_counter() - trace_ctx.start)
+    if params.response.status == 429:
+        metrics_inc("http_429", endpoint)
+    elif params.response.status >= 400:
+        metrics_inc("http_error", endpoint)
+
+async def on_http_request_exception(session, trace_ctx, params):
+    http_in_flight[trace_ctx.host] -= 1
+    metrics_inc("http_error", http_endpoint(params.url))
+
+# Connection events don't carry the URL, the host comes from the same request's trace_ctx
+async def on_http_connection_queued_start(session, trace_ctx, params):
+    trace_ctx.queued_at = time.perf_counter()
+
+async def on_http_connection_queued_end(session, trace_ctx, params):
+    metrics_observe("http_pool_wait", trace_ctx.host, time.perf_counter() - trace_ctx.queued_at)
+
+async def on_http_connection_create_end(session, trace_ctx, params):
+    metrics_inc("http_conn_created", trace_ctx.host)
+
+async def on_http_connection_reuseconn(session, trace_ctx, params):
+    metrics_inc("http_conn_reused", trace_ctx.host)
+
+http_in_flight = defaultdict(int)  # host -> requests currently holding a pooled connection
+http_trace = aiohttp.TraceConfig()
+http_trace.on_request_start.append(on_http_request_start)
+http_trace.on_request_end.append(on_http_request_end)
+http_trace.on_request_exception.append(on_http_request_exception)
+http_trace.on_connection_queued_start.append(on_http_connection_queued_start)
+http_trace.on_connection_queued_end.append(on_http_connection_queued_end)
+http_trace.on_connection_create_end.append(on_http_connection_create_end)
+http_trace.on_connection_reuseconn.append(on_http_connection_reuseconn)
+
+async def timed_trigger(name, coro):
+    start = time.perf_counter()
+    try:
+        await coro
+    finally:
+        metrics_observe("trigger", name, time.perf_counter() - start)
+
+
+# ======= Worker Pools =======
+# פרסור HTML ופאזי מאץ' לא רצים יותר על הלופ, אחרת סנכרון ביקורות תוקע את הטריגרים לכולם.
+# "thread" למשימות קטנות (rapidfuzz ו-lxml משחררים את ה-GIL), "process" לפרסור כבד (בלי WORKER_PROCESSES זה נופל לת'רדים)
+worker_pools = {}
+loop_lag_task = None
+
+def get_worker_pool(kind):
+    if kind == "process" and WORKER_PROCESSES <= 0:
+        if "process" not in worker_pools:
+            logging.warning("WORKER_PROCESSES is 0, HTML parsing runs in the thread pool and still holds the GIL")
+            worker_pools["process"] = get_worker_pool("thread")
+        return worker_pools["process"]
+    pool = worker_pools.get(kind)
+    if pool is None:
+        if kind == "process":
+            # spawn, not fork: forking a process that already runs threads and an event loop isn't safe
+            pool = ProcessPoolExecutor(max_workers=WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            pool = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="mika-worker")
+        worker_pools[kind] = pool
+    return pool
 
-# ======= Helper Functions =======
-def clean_message_content(content):
-    return re.sub(r"http\S+", "", content)
+async def run_in_worker(kind, func, *args):
+    # Functions sent to the process pool have to be module-level and return picklable values
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_worker_pool(kind), func, *args)
+    finally:
+        metrics_observe("worker", func.__name__, time.perf_counter() - start)
+
+def shutdown_worker_pools():
+    for pool in worker_pools.values():
+        pool.shutdown(wait=False, cancel_futures=True)
+    worker_pools.clear()
+
+async def run_loop_lag_monitor():
+    # Sleeps a fixed interval and measures how late the loop woke it up
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(loop.time() - start - LOOP_LAG_INTERVAL, 0.0)
+        metrics_observe("loop", "lag", lag)
+        if lag > LOOP_LAG_WARN:
+            metrics_inc("loop_lag_over", f"{LOOP_LAG_WARN}s")
+            logging.warning(f"Event loop lagged {lag * 1000:.0f}ms")
+
+
+# ======= Single Flight =======
+# בקשות/עבודות זהות שרצות במקביל מחכות לאותו טאסק במקום להריץ הכל פעמיים ולדרוס אחת לשנייה את אותם גלובלים.
+# עבודה ארוכה יכולה לדווח התקדמות ב-flight.report וכל מי שמחכה לה רואה אותה
+FLIGHT_PROGRESS_INTERVAL = 3
+
+class Flight:
+    __slots__ = ("task", "progress", "waiters")
+
+    def __init__(self):
+        self.task = None
+        self.progress = None
+        self.waiters = 0  # callers inside single_flight
+
+    def report(self, progress):
+        self.progress = progress
+
+flights = {}  # key -> Flight still running
+
+def start_flight(key, job):
+    # job(flight) returns the coroutine to run. Returns (flight, joined) so callers can tell they piggybacked
+    flight = flights.get(key)
+    if flight is not None:
+        metrics_inc("single_flight_joined", str(key[0]))
+        return flight, True
+    flight = Flight()
+    flight.task = asyncio.create_task(job(flight))
+    flights[key] = flight
+    flight.task.add_done_callback(lambda _: end_flight(key, flight))
+    return flight, False
+
+def end_flight(key, flight):
+    # A cancelled flight leaves right away, so only drop the entry if it is still this one
+    if flights.get(key) is flight:
+        del flights[key]
+
+async def single_flight(key, job):
+    flight, _ = start_flight(key, job)
+    flight.waiters += 1
+    try:
+        # shield: one caller giving up (a command deadline, a losing hedged search) must not cancel the job for
+        # everyone else. When the last one leaves nobody wants the result, so the request itself is aborted
+        return await asyncio.shield(flight.task)
+    finally:
+        flight.waiters -= 1
+        if not flight.waiters and not flight.task.done():
+            flight.task.cancel()
+            end_flight(key, flight)
+
+async def await_flight(flight, on_progress):
+    # Like single_flight, but hands every new progress report to on_progress while waiting
+    shown = None
+    while True:
+        done, _ = await asyncio.wait([flight.task], timeout=FLIGHT_PROGRESS_INTERVAL)
+        if done:
+            return flight.task.result()
+        if flight.progress != shown:
+            shown = flight.progress
+            await on_progress(shown)
+
+
+# ======= HTTP Client =======
+# סשן אחד לכל הבוט: מאגר חיבורים לכל הוסט עם keep-alive, קאש ל-DNS, ותקציב זמן לכל בקשה לפי היעד
+# כדי שבקשה תקועה לסטים או לדיסקוגס לא תתקע פקודה לנצח
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 100))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", 10))
+HTTP_KEEPALIVE = 30
+HTTP_DNS_TTL = 300
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_TIMEOUT_DEFAULT = 30
+HTTP_TIMEOUTS = [  # (URL prefix, total seconds for one request)
+    (DISCOGS_API, 10),
+    (SPOTIFY_ACCOUNTS_API, 8),
+    (SPOTIFY_API, 8),
+    (STEAM_STORE_API, 20),
+]
+ALBUM_DEADLINE = 45
+CURATOR_SYNC_DEADLINE = 900
 
-def word_in_text(word, text):
-    return re.search(rf'\b{re.escape(word)}\b', text, re.IGNORECASE)
+def http_timeout(url):
+    for prefix, total in HTTP_TIMEOUTS:
+        if url.startswith(prefix):
+            return aiohttp.ClientTimeout(total=total, connect=HTTP_CONNECT_TIMEOUT)
+    return aiohttp.ClientTimeout(total=HTTP_TIMEOUT_DEFAULT, connect=HTTP_CONNECT_TIMEOUT)
 
 async def get_session():
     global aiohttp_session
     if aiohttp_session is None or aiohttp_session.closed:
-        aiohttp_session = aiohttp.ClientSession()
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE,
+            ttl_dns_cache=HTTP_DNS_TTL
+        )
+        aiohttp_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_DEFAULT, connect=HTTP_CONNECT_TIMEOUT),
+            trace_configs=[http_trace]
+        )
     return aiohttp_session
 
+async def close_http_session():
+    global aiohttp_session
+    if aiohttp_session and not aiohttp_session.closed:
+        await aiohttp_session.close()
+    aiohttp_session = None
+
+
+# ======= HTTP Cache =======
+# מה שדיסקוגס וספוטיפיי מחזירים נשמר בסקיולייט כדי שאותה בקשה לא תצא שוב לרשת, גם אחרי ריסטארט
+def url_key_prefix(base):
+    parts = urllib.parse.urlsplit(base)
+    return f"{parts.netloc}{parts.path}"
+
+DISCOGS_KEY_PREFIX = url_key_prefix(DISCOGS_API)
+SPOTIFY_KEY_PREFIX = url_key_prefix(SPOTIFY_API)
+HTTP_CACHE_TTLS = [
+    (f"{DISCOGS_KEY_PREFIX}/database/search", 6 * 3600),
+    (f"{DISCOGS_KEY_PREFIX}/masters/", 7 * 86400),
+    (f"{DISCOGS_KEY_PREFIX}/releases/", 7 * 86400),
+    (f"{SPOTIFY_KEY_PREFIX}/v1/search", 86400),
+    (f"{SPOTIFY_KEY_PREFIX}/v1/albums/", 7 * 86400),
+]
+HTTP_CACHE_NEGATIVE_TTL = 3600
+http_cache_db = None
+# The cache file is shared between clusters and a write can wait on another process's lock, so every query
+# runs in a worker thread. One connection for all of them, the lock keeps it to one thread at a time
+http_cache_lock = threading.Lock()
+
+def get_http_cache():
+    global http_cache_db
+    if http_cache_db is None:
+        # WAL so several cluster processes can read while one of them writes
+        http_cache_db = sqlite3.connect(HTTP_CACHE_PATH, timeout=10, check_same_thread=False)
+        http_cache_db.execute("PRAGMA journal_mode=WAL")
+        http_cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        http_cache_db.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+        http_cache_db.commit()
+    return http_cache_db
+
+def http_cache_get(key):
+    with http_cache_lock:
+        row = get_http_cache().execute("SELECT body, expires FROM responses WHERE key = ?", (key,)).fetchone()
+    if row and row[1] > time.time():
+        return json.loads(row[0])
+    return None
+
+def http_cache_put(key, data, expires):
+    body = json.dumps(data, ensure_ascii=False)
+    with http_cache_lock:
+        db = get_http_cache()
+        db.execute("INSERT OR REPLACE INTO responses (key, body, expires) VALUES (?, ?, ?)", (key, body, expires))
+        db.commit()
+
+def http_cache_key(url):
+    # The Discogs token is in the query string, it shouldn't be part of the key
+    parts = urllib.parse.urlsplit(url)
+    query = sorted((k, v.strip().lower()) for k, v in urllib.parse.parse_qsl(parts.query) if k != "token")
+    return f"{parts.netloc}{parts.path}?{urllib.parse.urlencode(query)}"
+
+def http_cache_ttl(key, data):
+    for prefix, ttl in HTTP_CACHE_TTLS:
+        if key.startswith(prefix):
+            if data.get("results") == [] or data.get("albums", {}).get("items") == []:
+                return HTTP_CACHE_NEGATIVE_TTL
+            return ttl
+    return 0
+
+async def cached_get_json(url, headers=None, priority=None):
+    key = http_cache_key(url)
+    data = await run_in_worker("thread", http_cache_get, key)
+    if data is not None:
+        metrics_inc("http_cache", "hit")
+        return 200, data
+    metrics_inc("http_cache", "miss")
+    # Identical misses in flight at the same time share one request. Priority is part of the key so a command
+    # never ends up waiting behind a background prefetch of the same URL
+    return await single_flight(("http", key, priority), lambda flight: fetch_and_cache_json(url, key, headers, priority))
+
+async def fetch_and_cache_json(url, key, headers, priority):
+    if key.startswith(f"{DISCOGS_KEY_PREFIX}/"):
+        status, data = await discogs_get_json(url, PRIORITY_INTERACTIVE if priority is None else priority)
+    else:
+        session = await get_session()
+        async with session.get(url, headers=headers, timeout=http_timeout(url)) as resp:
+            if resp.status != 200:
+                return resp.status, None
+            data = await resp.json()
+            status = 200
+    if status != 200:
+        return status, None
+    ttl = http_cache_ttl(key, data)
+    if ttl:
+        await run_in_worker("thread", http_cache_put, key, data, time.time() + ttl)
+    return 200, data
+
+
+# ======= Discogs Rate Limit =======
+# דיסקוגס נותנים 60 בקשות לדקה עם טוקן. כל הבקשות עוברות דרך דלי טוקנים אחד שמתעדכן לפי ההדרים שלהם,
+# ופקודות של משתמשים עוקפות בתור עבודות רקע
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+DISCOGS_MAX_RETRIES = 3
+DISCOGS_BACKOFF_BASE = 2
+
+discogs_bucket = {"limit": 60, "tokens": 60.0, "updated": 0.0, "paused_until": 0.0}
+discogs_waiters = []  # heap of (priority, seq, future)
+discogs_seq = itertools.count()
+discogs_wakeup = None
+discogs_dispatcher = None
+
+def discogs_refill():
+    now = time.monotonic()
+    rate = discogs_bucket["limit"] / 60
+    discogs_bucket["tokens"] = min(discogs_bucket["limit"], discogs_bucket["tokens"] + (now - discogs_bucket["updated"]) * rate)
+    discogs_bucket["updated"] = now
+    return now
+
+def discogs_update_limits(headers):
+    limit = headers.get("X-Discogs-Ratelimit")
+    used = headers.get("X-Discogs-Ratelimit-Used")
+    remaining = headers.get("X-Discogs-Ratelimit-Remaining")
+    if limit:
+        discogs_bucket["limit"] = int(limit)
+    if remaining is None and used is not None:
+        remaining = discogs_bucket["limit"] - int(used)
+    if remaining is not None:
+        # The server counts a moving 60 second window, trust it over our own estimate
+        discogs_refill()
+        discogs_bucket["tokens"] = min(discogs_bucket["tokens"], int(remaining))
+
+async def run_discogs_dispatcher():
+    while True:
+        if not discogs_waiters:
+            discogs_wakeup.clear()
+            await discogs_wakeup.wait()
+            continue
+        now = discogs_refill()
+        if now < discogs_bucket["paused_until"]:
+            await asyncio.sleep(discogs_bucket["paused_until"] - now)
+            continue
+        if discogs_bucket["tokens"] < 1:
+            await asyncio.sleep((1 - discogs_bucket["tokens"]) * 60 / discogs_bucket["limit"])
+            continue
+        _, _, fut = heapq.heappop(discogs_waiters)
+        if fut.done():  # the waiting command was cancelled
+            continue
+        discogs_bucket["tokens"] -= 1
+        fut.set_result(None)
+
+async def discogs_acquire(priority=PRIORITY_INTERACTIVE):
+    global discogs_dispatcher, discogs_wakeup
+    if discogs_dispatcher is None or discogs_dispatcher.done():
+        discogs_wakeup = asyncio.Event()
+        discogs_dispatcher = asyncio.create_task(run_discogs_dispatcher())
+    fut = asyncio.get_running_loop().create_future()
+    heapq.heappush(discogs_waiters, (priority, next(discogs_seq), fut))
+    discogs_wakeup.set()
+    await fut
+
+async def discogs_get_json(url, priority=PRIORITY_INTERACTIVE):
+    session = await get_session()
+    for attempt in range(DISCOGS_MAX_RETRIES + 1):
+        await discogs_acquire(priority)
+        async with session.get(url, timeout=http_timeout(url)) as resp:
+            discogs_update_limits(resp.headers)
+            if resp.status == 429 and attempt < DISCOGS_MAX_RETRIES:
+                retry_after = resp.headers.get("Retry-After")
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else DISCOGS_BACKOFF_BASE * 2 ** attempt
+                # Everyone waits, not just this request - the whole token is over the limit
+                discogs_bucket["paused_until"] = max(discogs_bucket["paused_until"], time.monotonic() + delay + random.uniform(0, 0.5))
+                continue
+            if resp.status != 200:
+                return resp.status, None
+            return 200, await resp.json()
+
+
+# ======= Fuzzy Matching =======
+# מילון אומנים שגדל מכל חיפוש בדיסקוגס (שם, ID וכינויים שאנשים כתבו). רק כינוי מדויק נפתר מקומית,
+# התאמה פאזית היא רק רמז למקרה שדיסקוגס לא עונה - "Futures" הוא לא "Future".
+# כל הניקוד עובר דרך batch_scores - קריאה אחת ל-rapidfuzz על כל רשימת המועמדים במקום לולאה בפייתון
+ARTIST_MATCH_THRESHOLD = 90
+
+def batch_scores(query, choices, scorer, score_cutoff=None):
+    # cdist hands back a numpy array; without numpy, extract(limit=None) is the same single C call.
+    # Anything under score_cutoff comes back as 0, which lets rapidfuzz skip most of the work
+    if not choices:
+        return []
+    if HAS_NUMPY:
+        return process.cdist([query], choices, scorer=scorer, score_cutoff=score_cutoff)[0].tolist()
+    scores = [0] * len(choices)
+    for _, score, idx in process.extract(query, choices, scorer=scorer, limit=None, score_cutoff=score_cutoff):
+        scores[idx] = score
+    return scores
+
+def best_score_index(scores):
+    # First index wins ties, like extractOne and the old stable sort did
+    return max(range(len(scores)), key=scores.__getitem__)
+
+def artist_match_key(name):
+    return " ".join(clean_discogs_artist(name).lower().split())
+
+def artist_alias_key(name):
+    # Exact up to case and spacing. The "(n)" Discogs adds to tell artists apart stays, so "Future (4)" never answers "Future"
+    return " ".join(name.lower().split())
+
+class ArtistDictionary:
+    def __init__(self, path):
+        self.path = path
+        self.names = []
+        self.ids = []
+        self.keys = []  # artist_match_key of each name, computed once
+        self.by_name = {}
+        self.aliases = {}  # artist_alias_key(name or alias) -> index into names
+
+    def __len__(self):
+        return len(self.names)
+
+    def _add(self, name, discogs_id=None, alias=None):
+        changed = False
+        idx = self.by_name.get(name)
+        if idx is None:
+            idx = self.by_name[name] = len(self.names)
+            self.names.append(name)
+            self.ids.append(discogs_id)
+            self.keys.append(artist_match_key(name))
+            self.aliases.setdefault(artist_alias_key(name), idx)
+            changed = True
+        elif discogs_id and not self.ids[idx]:
+            self.ids[idx] = discogs_id
+            changed = True
+        if alias:
+            key = artist_alias_key(alias)
+            if self.aliases.get(key) != idx:
+                self.aliases[key] = idx
+                changed = True
+        return changed
+
+    def lookup(self, user_input):
+        idx = self.aliases.get(artist_alias_key(user_input))
+        return None if idx is None else self.names[idx]
+
+    def match(self, user_input):
+        # Runs in a worker thread. The lists only ever grow, so a slice is a consistent snapshot
+        keys = self.keys[:]
+        if not keys:
+            return None
+        scores = batch_scores(artist_match_key(user_input), keys, fuzz.ratio, ARTIST_MATCH_THRESHOLD)
+        idx = best_score_index(scores)
+        return self.names[idx] if scores[idx] >= ARTIST_MATCH_THRESHOLD else None
+
+    async def load(self):
+        try:
+            async with aiofiles.open(self.path, "r", encoding="utf-8") as f:
+                async for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._add(entry["name"], entry.get("id"), entry.get("alias"))
+        except FileNotFoundError:
+            pass
+
+    async def add(self, entries):
+        lines = [
+            json.dumps({"name": name, "id": discogs_id, "alias": alias}, ensure_ascii=False) + "\n"
+            for name, discogs_id, alias in entries if self._add(name, discogs_id, alias)
+        ]
+        if lines:
+            async with aiofiles.open(self.path, "a", encoding="utf-8") as f:
+                await f.write("".join(lines))
+
+artist_dictionary = ArtistDictionary(ARTIST_DICT_PATH)
+
+
+# ======= Helper Functions =======
+def clean_message_content(content):
+    return re.sub(r"http\S+", "", content)
+
+def compile_triggers(triggers):
+    # כל הטריגרים בריגקס אחד. הלוקאהד בודק כל מיקום בהודעה כדי שמילים חופפות לא יתפספסו,
+    # והקבוצות מסודרות לפי העדיפות כך שבאותו מיקום הטריגר הראשון ברשימה מנצח
+    groups = "|".join(
+        f"(?P<t{i}>{'|'.join(re.escape(w) for w in keywords)})"
+        for i, (keywords, _) in enumerate(triggers)
+    )
+    return re.compile(rf"(?=\b(?:{groups})\b)", re.IGNORECASE)
+
+def match_trigger(pattern, text):
+    best = None
+    for m in pattern.finditer(text):
+        idx = int(m.lastgroup[1:])
+        if best is None or idx < best:
+            best = idx
+            if best == 0:
+                break
+    return best
+
+def has_class(name):
+    # SoupStrainer sees the raw class attribute ("wikitable sortable"), not the split list find_all matches against
+    return lambda value: bool(value) and name in (value if isinstance(value, list) else value.split())
+
+def parse_html(html, only=None):
+    # lxml when it's installed, and only the tags the scraper actually reads get built into the tree.
+    # `only` is (tag, attrs) so the strainers can be module constants without importing bs4 up front
+    return bs4.BeautifulSoup(html, HTML_PARSER, parse_only=bs4.SoupStrainer(*only) if only else None)
+
 def clean_discogs_artist(name):
     return re.sub(r"\s*\(\d+\)", "", name).strip()
 
@@ -78,7 +791,7 @@ def clean_album_title(title):
     title = re.sub(r"[–:.,]", "", title)
     return re.sub(r"\s+", " ", title).strip()
 
-async def get_spotify_token(client_id, client_secret):
+async def fetch_spotify_token(client_id, client_secret):
     auth = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
     headers = {
         "Authorization": f"Basic {auth}",
@@ -86,17 +799,77 @@ async def get_spotify_token(client_id, client_secret):
     }
     data = "grant_type=client_credentials"
     session = await get_session()
+    url = f"{SPOTIFY_ACCOUNTS_API}/api/token"
     async with session.post(
-        "https://accounts.spotify.com/api/token",
+        url,
         data=data,
-        headers=headers
+        headers=headers,
+        timeout=http_timeout(url)
     ) as resp:
         result = await resp.json()
-        return result.get("access_token")
-
-async def get_spotify_album_url(token, album, artist): #בגלל שדיסקוגס מגבילים את הכמות מידע שאפשר לקחת והרבה פעמים האלבום קאבר & טראקליסט די גרועים באתר, החלטתי לקחת אותם דרך ספוטיפיי
-    headers = {"Authorization": f"Bearer {token}"}
-
+        return result.get("access_token"), result.get("expires_in", 3600)
+
+# הטוקן של ספוטיפיי תקף לשעה, אין סיבה לבקש חדש בכל פעם שמישהו מריץ album
+SPOTIFY_TOKEN_EXPIRY_MARGIN = 60
+SPOTIFY_TOKEN_REFRESH_AHEAD = 300
+SPOTIFY_HEDGE_DELAY = float(os.getenv("SPOTIFY_HEDGE_DELAY", 0.05))
+SPOTIFY_TOKEN_RETRY = 30
+spotify_token = {"access_token": None, "expires_at": 0}
+spotify_token_refresh = None
+spotify_token_timer = None
+
+def schedule_spotify_token_refresh(delay):
+    # טיימר על הלופ מחדש את הטוקן לפני שהוא פג, ככה גם הפקודה הראשונה אחרי שקט ארוך לא מחכה לספוטיפיי
+    global spotify_token_timer
+    if spotify_token_timer is not None:
+        spotify_token_timer.cancel()
+    spotify_token_timer = asyncio.get_running_loop().call_later(max(delay, 0), start_spotify_token_refresh)
+
+async def refresh_spotify_token():
+    try:
+        access_token, expires_in = await fetch_spotify_token(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET)
+    except Exception:
+        logging.exception("Spotify token refresh failed")
+        access_token, expires_in = None, 0
+    if access_token:
+        spotify_token["access_token"] = access_token
+        spotify_token["expires_at"] = time.monotonic() + expires_in - SPOTIFY_TOKEN_EXPIRY_MARGIN
+        schedule_spotify_token_refresh(expires_in - SPOTIFY_TOKEN_EXPIRY_MARGIN - SPOTIFY_TOKEN_REFRESH_AHEAD)
+    elif spotify_token["expires_at"] > time.monotonic():
+        # The current token is still good for a while, try again before it runs out
+        schedule_spotify_token_refresh(SPOTIFY_TOKEN_RETRY)
+    return access_token
+
+def start_spotify_token_refresh():
+    # כמה פקודות בו זמנית מחכות לאותו ריפרש במקום שכל אחת תבקש טוקן משלה
+    global spotify_token_refresh
+    if spotify_token_refresh is None or spotify_token_refresh.done():
+        spotify_token_refresh = asyncio.create_task(refresh_spotify_token())
+    return spotify_token_refresh
+
+async def get_spotify_token(stale=None):
+    token = spotify_token["access_token"]
+    remaining = spotify_token["expires_at"] - time.monotonic()
+    if token and token != stale and remaining > 0:
+        if remaining < SPOTIFY_TOKEN_REFRESH_AHEAD:
+            start_spotify_token_refresh()
+        return token
+    # asyncio.shield so a cancelled command doesn't cancel the refresh other commands are waiting on
+    return await asyncio.shield(start_spotify_token_refresh())
+
+async def spotify_get_json(url):
+    token = await get_spotify_token()
+    if not token:
+        return None, None
+    status, data = await cached_get_json(url, headers={"Authorization": f"Bearer {token}"})
+    if status == 401:
+        # Revoked or expired early - one forced refresh, one retry
+        token = await get_spotify_token(stale=token)
+        if token:
+            status, data = await cached_get_json(url, headers={"Authorization": f"Bearer {token}"})
+    return status, data
+
+async def get_spotify_album_url(album, artist): #בגלל שדיסקוגס מגבילים את הכמות מידע שאפשר לקחת והרבה פעמים האלבום קאבר & טראקליסט די גרועים באתר, החלטתי לקחת אותם דרך ספוטיפיי
     def clean_artist_for_spotify(a):
         a = re.sub(r"\s*\(\d+\)", "", a)
         a = re.split(r'feat\.|,', a, flags=re.IGNORECASE)[0]
@@ -114,196 +887,575 @@ async def get_spotify_album_url(token, album, artist): #בגלל שדיסקוג
         f"album:{album}",
         f"album:{clean_album_for_spotify(album)}",
     ]
-    session = await get_session()
-    for query in queries: # מכאן הלאה אני די בטוח שהתחלתי להשתגע כבר, צ'אט רשם כמעט את כל שאר הפקודה הזאת
-        search_url = f"https://api.spotify.com/v1/search?q={urllib.parse.quote(query)}&type=album&limit=10"
-        async with session.get(search_url, headers=headers) as resp:
-            result = await resp.json()
-            items = result.get("albums", {}).get("items", [])
-            if not items:
-                continue
-            # Use rapidfuzz to find the best match by both album and artist name
-            cleaned_album = clean_album_for_spotify(album)
-            cleaned_artist = clean_artist_for_spotify(artist)
-            scored = []
-            for album_data in items:
-                name_score = fuzz.token_set_ratio(clean_album_for_spotify(album_data["name"]), cleaned_album)
-                # Try to find primary artist
-                artists = [a["name"] for a in album_data.get("artists", [])]
-                main_artist = artists[0] if artists else ""
-                artist_score = fuzz.token_set_ratio(clean_artist_for_spotify(main_artist), cleaned_artist)
-                total_score = (name_score + artist_score) / 2
-                scored.append((total_score, album_data))
-            scored.sort(reverse=True, key=lambda tup: tup[0])
-            # Set a reasonable threshold for "close enough" (e.g., 80+)
-            best_score, best_album = scored[0]
-            if best_score >= 80:
-                spotify_url = best_album["external_urls"]["spotify"]
-                images = best_album.get("images", [])
-                image_url = images[0]["url"] if images else None
-                album_id = best_album["id"]
-                # Now fetch the album details for tracklist
-                album_api_url = f"https://api.spotify.com/v1/albums/{album_id}"
-                async with session.get(album_api_url, headers=headers) as album_resp:
-                    album_info = await album_resp.json()
-                    spotify_tracks = []
-                    for i, track in enumerate(album_info.get("tracks", {}).get("items", []), 1):
-                        name = track.get("name")
-                        if name:
-                            spotify_tracks.append(f"**{i}.** {name}")
-                    return spotify_url, image_url, spotify_tracks
-            # If no close match, continue trying other queries
-    return None, None, None
-
-
-async def resolve_discogs_artist_name(user_input, discogs_token):
-    url = f"https://api.discogs.com/database/search?type=artist&q={urllib.parse.quote(user_input)}&per_page=5&token={discogs_token}"
-    session = await get_session()
-    async with session.get(url) as resp:
-        if resp.status != 200:
-            return user_input
-        data = await resp.json()
-        results = data.get("results", [])
-        if not results:
-            return user_input
-        titles = [r.get("title", "") for r in results]
-        best_match, score, idx = process.extractOne(user_input, titles, scorer=fuzz.ratio) #מנסה לקחת את האומן שהכי הגיוני
-        #כאשר יש אומנים רבים עם אותו השם דיסקוגס מביא להם מספרים - אומן (1) & אומן (2)
-        #אז בשביל שזה לא יביא יוצר רנדומלי עם שירים מלפני ארבע מאות שנה שרושמים שם של אומן, זה יביא את האחד ההרבה יותר מוכר
-        print(f"[DEBUG] resolve_discogs_artist_name: Input: '{user_input}', Best match: '{best_match}', Score: {score}")
-        if score >= 75:
-            return best_match
-        return titles[0] if titles else user_input
+    # When there's nothing to clean several variants come out identical, no point searching twice
+    queries = list(dict.fromkeys(queries))
+    cleaned_album = clean_album_for_spotify(album)
+    cleaned_artist = clean_artist_for_spotify(artist)
+
+    started = [asyncio.Event() for _ in queries]
+
+    async def search(i, query): # מכאן הלאה אני די בטוח שהתחלתי להשתגע כבר, צ'אט רשם כמעט את כל שאר הפקודה הזאת
+        # Each variant starts SPOTIFY_HEDGE_DELAY after the one before it, or right away if that one already missed
+        if i:
+            await started[i - 1].wait()
+            await asyncio.wait([tasks[i - 1]], timeout=SPOTIFY_HEDGE_DELAY)
+        started[i].set()
+        search_url = f"{SPOTIFY_API}/v1/search?q={urllib.parse.quote(query)}&type=album&limit=10"
+        status, result = await spotify_get_json(search_url)
+        items = (result or {}).get("albums", {}).get("items", [])
+        if not items:
+            return None
+        return await run_in_worker("thread", score_albums, items)
+
+    def score_albums(items):
+        # Use rapidfuzz to find the best match by both album and artist name, scored in one batch per field
+        names = [clean_album_for_spotify(album_data["name"]) for album_data in items]
+        # Try to find primary artist
+        main_artists = [clean_artist_for_spotify(album_data["artists"][0]["name"]) if album_data.get("artists") else ""
+                        for album_data in items]
+        name_scores = batch_scores(cleaned_album, names, fuzz.token_set_ratio)
+        artist_scores = batch_scores(cleaned_artist, main_artists, fuzz.token_set_ratio)
+        totals = [(n + a) / 2 for n, a in zip(name_scores, artist_scores)]
+        best = best_score_index(totals)
+        # Set a reasonable threshold for "close enough" (e.g., 80+)
+        return items[best] if totals[best] >= 80 else None
+
+    # The variants overlap, but the results are taken in query order,
+    # so a later query that answers first never beats an earlier one that also matches
+    tasks = [asyncio.create_task(search(i, query)) for i, query in enumerate(queries)]
+    try:
+        for task in tasks:
+            best_album = await task
+            if best_album:
+                break
+        else:
+            return None, None, None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    spotify_url = best_album["external_urls"]["spotify"]
+    images = best_album.get("images", [])
+    image_url = images[0]["url"] if images else None
+    album_id = best_album["id"]
+    # Now fetch the album details for tracklist
+    album_api_url = f"{SPOTIFY_API}/v1/albums/{album_id}"
+    status, album_info = await spotify_get_json(album_api_url)
+    spotify_tracks = []
+    for i, track in enumerate((album_info or {}).get("tracks", {}).get("items", []), 1):
+        name = track.get("name")
+        if name:
+            spotify_tracks.append(f"**{i}.** {name}")
+    return spotify_url, image_url, spotify_tracks
+
+
+def best_artist_match(user_input, titles):
+    scores = batch_scores(user_input, titles, fuzz.ratio)
+    idx = best_score_index(scores)
+    return titles[idx], scores[idx], idx
+
+async def resolve_discogs_artist_name(user_input, discogs_token, priority=None):
+    # An exact known alias answers locally. Anything else goes to Discogs, the fuzzy dictionary match is only
+    # the fallback when Discogs fails, and it never becomes an alias
+    name = artist_dictionary.lookup(user_input)
+    if name:
+        metrics_inc("artist_match", "alias")
+        return name
+    url = f"{DISCOGS_API}/database/search?type=artist&q={urllib.parse.quote(user_input)}&per_page=5&token={discogs_token}"
+    status, data = await cached_get_json(url, priority=priority)
+    results = data.get("results", []) if status == 200 else []
+    if not results:
+        name = await run_in_worker("thread", artist_dictionary.match, user_input)
+        metrics_inc("artist_match", "fuzzy" if name else "miss")
+        return name or user_input
+    metrics_inc("artist_match", "discogs")
+    titles = [r.get("title", "") for r in results]
+    best_match, score, idx = await run_in_worker("thread", best_artist_match, user_input, titles) #מנסה לקחת את האומן שהכי הגיוני
+    #כאשר יש אומנים רבים עם אותו השם דיסקוגס מביא להם מספרים - אומן (1) & אומן (2)
+    #אז בשביל שזה לא יביא יוצר רנדומלי עם שירים מלפני ארבע מאות שנה שרושמים שם של אומן, זה יביא את האחד ההרבה יותר מוכר
+    logging.debug("resolve_discogs_artist_name: Input: '%s', Best match: '%s', Score: %s", user_input, best_match, score)
+    # Every artist Discogs returned is worth keeping. What the user typed only becomes an alias on a confident match,
+    # otherwise a typo would be pinned to whatever Discogs happened to list first
+    alias = user_input if score >= 75 else None
+    await artist_dictionary.add([
+        (r["title"], r.get("id"), alias if r["title"] == best_match else None) for r in results if r.get("title")
+    ])
+    if score >= 75:
+        return best_match
+    return titles[0]
 
 
 
 # ======= Yerkalator Goonerapist Jr. =======
+WIKIPEDIA_TABLES = ("table", {"class": has_class("wikitable")})
+TABLE_ROWS = ("tr",)
+
+def parse_wikipedia_gacha_games(html):
+    games = []
+    soup = parse_html(html, WIKIPEDIA_TABLES)
+    tables = soup.find_all('table', {'class': 'wikitable'})
+    for table in tables:
+        rows = table.find_all('tr')[1:]
+        for row in rows:
+            cells = row.find_all('td')
+            if cells:
+                link_tag = cells[0].find('a')
+                if link_tag and link_tag.get('href'):
+                    game_name = link_tag.get_text(strip=True)
+                    game_link = f"https://en.wikipedia.org{link_tag['href']}"
+                    games.append(f"[Wikipedia] [{game_name}]({game_link})")
+    return games
+
 async def fetch_wikipedia_gacha_games():
     url = "https://en.wikipedia.org/wiki/List_of_gacha_games"
     session = await get_session()
-    async with session.get(url) as response:
-        if response.status == 200:
-            html = await response.text()
-            soup = BeautifulSoup(html, 'html.parser')
-            tables = soup.find_all('table', {'class': 'wikitable'})
-            for table in tables:
-                rows = table.find_all('tr')[1:]
-                for row in rows:
-                    cells = row.find_all('td')
-                    if cells:
-                        link_tag = cells[0].find('a')
-                        if link_tag and link_tag.get('href'):
-                            game_name = link_tag.get_text(strip=True)
-                            game_link = f"https://en.wikipedia.org{link_tag['href']}"
-                            gacha_games.append(f"[Wikipedia] [{game_name}]({game_link})")
+    async with session.get(url, timeout=http_timeout(url)) as response:
+        if response.status != 200:
+            return []
+        html = await response.text()
+    return await run_in_worker("process", parse_wikipedia_gacha_games, html)
+
+def parse_fandom_gacha_games(html):
+    games = []
+    soup = parse_html(html, TABLE_ROWS)
+    rows = soup.find_all('tr')
+    for row in rows:
+        link_tag = row.find('a')
+        if link_tag and link_tag.get('href') and "/wiki/" in link_tag['href']:
+            game_name = link_tag.get_text(strip=True)
+            game_link = f"https://gachagames.fandom.com{link_tag['href']}"
+            games.append(f"[Fandom] [{game_name}]({game_link})")
+    return games
 
 async def fetch_fandom_gacha_games():
     url = "https://gachagames.fandom.com/wiki/List_of_Gacha_Games"
     session = await get_session()
-    async with session.get(url) as response:
-        if response.status == 200:
-            html = await response.text()
-            soup = BeautifulSoup(html, 'html.parser')
-            rows = soup.find_all('tr')
-            for row in rows:
-                link_tag = row.find('a')
-                if link_tag and link_tag.get('href') and "/wiki/" in link_tag['href']:
-                    game_name = link_tag.get_text(strip=True)
-                    game_link = f"https://gachagames.fandom.com{link_tag['href']}"
-                    gacha_games.append(f"[Fandom] [{game_name}]({game_link})")
+    async with session.get(url, timeout=http_timeout(url)) as response:
+        if response.status != 200:
+            return []
+        html = await response.text()
+    return await run_in_worker("process", parse_fandom_gacha_games, html)
 
 
 
 # ======= Sata Andagi :D =======
+STRONG_TAGS = ("strong",)
+
+def parse_fish_list(html):
+    fish = []
+    soup = parse_html(html, STRONG_TAGS)
+    strong_tags = soup.find_all('strong')
+    for tag in strong_tags:
+        link_tag = tag.find('a')
+        if link_tag and link_tag.get('href'):
+            fish_name = link_tag.get_text(strip=True)
+            fish_link = link_tag['href']
+            fish.append(f"[{fish_name}]({fish_link})")
+    return fish
+
 async def fetch_fish_list():
     url = "https://mexican-fish.com/fish-alphabetical-index-by-common-name/"
     session = await get_session()
-    async with session.get(url) as response:
-        if response.status == 200:
-            html = await response.text()
-            soup = BeautifulSoup(html, 'html.parser')
-            strong_tags = soup.find_all('strong')
-            for tag in strong_tags:
-                link_tag = tag.find('a')
-                if link_tag and link_tag.get('href'):
-                    fish_name = link_tag.get_text(strip=True)
-                    fish_link = link_tag['href']
-                    fish_list.append(f"[{fish_name}]({fish_link})")
+    async with session.get(url, timeout=http_timeout(url)) as response:
+        if response.status != 200:
+            return []
+        html = await response.text()
+    return await run_in_worker("process", parse_fish_list, html)
 
 
 
 
 # ======= Crack Smoking Time Reviews =======
-async def fetch_and_save_curator_reviews():
-    global curator_reviews
-    curator_reviews.clear()
-    start = 0
-    count = 50
-    session_url = "https://store.steampowered.com/curator/41625352-Crack-Smoking-Time/ajaxgetcuratorrecommendations"
-    temp_reviews = []
+CURATOR_URL = f"{STEAM_STORE_API}/curator/41625352-Crack-Smoking-Time/ajaxgetcuratorrecommendations"
+CURATOR_PAGE_SIZE = 50
+CURATOR_SYNC_CONCURRENCY = 4
+CURATOR_SYNC_INTERVAL = 6 * 3600
+CURATOR_SYNC_JITTER = 1800
+CURATOR_RECOMMENDATIONS = ("div", {"class": has_class("recommendation")})
+curator_sync_task = None
+
+# ביקורת אחת כמו שהיא נשמרת בזיכרון - app_id, הצבע והטקסט הנקי מחושבים פעם אחת כשהיא נכנסת
+Review = namedtuple("Review", ["game", "blurb", "verdict", "url", "app_id", "color", "text"])
+
+def make_review(raw):
+    match = re.search(r'/app/(\d+)', raw["url"])
+    if "Not Recommended" in raw["verdict"]:
+        color = discord.Color.red().value
+    elif "Recommended" in raw["verdict"]:
+        color = discord.Color.green().value
+    else:
+        color = discord.Color.gold().value
+    return Review(
+        game=raw["game"],
+        blurb=raw["blurb"],
+        verdict=raw["verdict"],
+        url=raw["url"],
+        app_id=match.group(1) if match else "",
+        color=color,
+        text=raw["blurb"].strip('"')
+    )
+
+def review_line(review):
+    return json.dumps(
+        {"game": review.game, "blurb": review.blurb, "verdict": review.verdict, "url": review.url},
+        ensure_ascii=False
+    ) + "\n"
+
+class ReviewStore:
+    # Reviews are bucketed by verdict and every review knows its slot in its bucket,
+    # so replacing/removing one is a swap with the bucket's last entry and picking one is random.choice
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.by_url = {}
+        self.buckets = defaultdict(list)
+        self.slots = {}
+        self.log_lines = 0
+
+    def __len__(self):
+        return len(self.by_url)
+
+    def get(self, url):
+        return self.by_url.get(url)
+
+    def _put(self, review):
+        old = self.by_url.get(review.url)
+        if old and old.verdict == review.verdict:
+            self.buckets[review.verdict][self.slots[review.url]] = review
+        else:
+            if old:
+                self._unslot(old)
+            bucket = self.buckets[review.verdict]
+            self.slots[review.url] = len(bucket)
+            bucket.append(review)
+        self.by_url[review.url] = review
+
+    def _unslot(self, review):
+        bucket = self.buckets[review.verdict]
+        idx = self.slots.pop(review.url)
+        last = bucket.pop()
+        if last.url != review.url:
+            bucket[idx] = last
+            self.slots[last.url] = idx
+
+    def _clear(self):
+        self.by_url.clear()
+        self.buckets.clear()
+        self.slots.clear()
+
+    def pick(self, verdict=None):
+        if verdict is not None:
+            bucket = self.buckets.get(verdict)
+            return random.choice(bucket) if bucket else None
+        buckets = [b for b in self.buckets.values() if b]
+        if not buckets:
+            return None
+        bucket = random.choices(buckets, weights=[len(b) for b in buckets])[0]
+        return random.choice(bucket)
+
+    def _swap(self, fresh):
+        # One assignment, so crack never sees a store that is halfway through a reload
+        self.by_url, self.buckets, self.slots, self.log_lines = fresh.by_url, fresh.buckets, fresh.slots, fresh.log_lines
+
+    async def load(self):
+        # The new index is built on the side and swapped in at the end, followers reload while serving commands
+        fresh = ReviewStore(self.path)
+        try:
+            async with aiofiles.open(self.path, "r", encoding="utf-8") as f:
+                lines = (await f.read()).splitlines()
+        except FileNotFoundError:
+            lines = None
+        if lines is not None:
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    raw = json.loads(line)
+                except ValueError:
+                    # Another cluster may be halfway through appending this line
+                    continue
+                # Later lines override earlier ones for the same game
+                fresh._put(make_review(raw))
+                fresh.log_lines += 1
+            self._swap(fresh)
+            return
+        # Migrate the old pretty-printed curator_reviews.json on first start
+        if not self.legacy_path:
+            self._swap(fresh)
+            return
+        try:
+            async with aiofiles.open(self.legacy_path, "r", encoding="utf-8") as f:
+                raw_reviews = json.loads(await f.read())
+        except Exception:
+            self._swap(fresh)
+            return
+        for raw in raw_reviews:
+            fresh._put(make_review(raw))
+        self._swap(fresh)
+        await self.rewrite()
+
+    async def rewrite(self):
+        tmp_path = self.path + ".tmp"
+        async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+            await f.write("".join(review_line(r) for r in self.by_url.values()))
+        os.replace(tmp_path, self.path)
+        self.log_lines = len(self.by_url)
+
+    async def update(self, reviews):
+        for review in reviews:
+            self._put(review)
+        if self.log_lines + len(reviews) > 2 * max(len(self.by_url), 1):
+            await self.rewrite()
+            return
+        async with aiofiles.open(self.path, "a", encoding="utf-8") as f:
+            await f.write("".join(review_line(r) for r in reviews))
+        self.log_lines += len(reviews)
+
+    async def replace_all(self, reviews):
+        self._clear()
+        for review in reviews:
+            self._put(review)
+        await self.rewrite()
+
+review_store = ReviewStore(REVIEW_STORE_PATH, legacy_path=REVIEW_JSON_PATH)
+
+def parse_curator_page(html):
+    # Plain dicts so the result pickles cleanly out of a worker process
+    reviews = []
+    soup = parse_html(html, CURATOR_RECOMMENDATIONS)
+    for div in soup.find_all("div", class_="recommendation"):
+        app_id = div.get("data-ds-appid")
+        if not app_id:
+            continue
+        app_url = f"https://store.steampowered.com/app/{app_id}"
+        a_tag = div.select_one(".recommmendation_app_small_cap_ctn a")
+        game_title = a_tag['href'].split('/')[5].replace('_', ' ') if a_tag else f"App ID {app_id}"
+        desc_tag = div.find("div", class_="recommendation_desc")
+        blurb = desc_tag.get_text(strip=True) if desc_tag else "No review text."
+        if div.find("span", class_="color_recommended"):
+            verdict = "✅ Recommended"
+        elif div.find("span", class_="color_not_recommended"):
+            verdict = "❌ Not Recommended"
+        elif div.find("span", class_="color_informational"):
+            verdict = "🧠 Informational"
+        else:
+            verdict = "🧠 Informational"
+        reviews.append({
+            "game": game_title,
+            "blurb": blurb,
+            "verdict": verdict,
+            "url": app_url
+        })
+    return reviews
+
+async def fetch_curator_page(start):
     headers = { # מסתבר שסטים לא אוהבים שקליינטים לא אמיתיים מנסים לתקשר עם השרתים שלהם :)
         "User-Agent": "Mozilla/5.0",
         "Referer": "https://store.steampowered.com/"
     }
     session = await get_session()
-    while True:
-        url = f"{session_url}?start={start}&count={count}"
-        async with session.get(url, headers=headers) as resp:
+    url = f"{CURATOR_URL}?start={start}&count={CURATOR_PAGE_SIZE}"
+    try:
+        async with session.get(url, headers=headers, timeout=http_timeout(url)) as resp:
             if resp.status != 200:
-                break
+                return None
             data = await resp.json()
-            html = data.get("results_html", "")
-            if not html.strip():
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None
+    html = data.get("results_html", "")
+    if not html.strip():
+        return []
+    return [make_review(raw) for raw in await run_in_worker("process", parse_curator_page, html)]
+
+async def fetch_and_save_curator_reviews(full=False, report=None):
+    # הפיד מגיע מהחדש לישן, אז בסנכרון רגיל אפשר לעצור בעמוד הראשון שכולו ביקורות שכבר יש לנו
+    fetched = []
+    start = 0
+    reached_end = False
+    done = False
+    while not done:
+        starts = [start + i * CURATOR_PAGE_SIZE for i in range(CURATOR_SYNC_CONCURRENCY)]
+        pages = await asyncio.gather(*(fetch_curator_page(s) for s in starts))
+        for page in pages:
+            if not page:
+                # None is a failed request, [] is past the last page
+                reached_end = page is not None
+                done = True
                 break
-            soup = BeautifulSoup(html, "html.parser")
-            review_divs = soup.find_all("div", class_="recommendation")
-            if not review_divs:
+            fetched.extend(page)
+            if not full and all(review_store.get(r.url) == r for r in page):
+                done = True
                 break
-            for div in review_divs:
-                app_id = div.get("data-ds-appid")
-                if not app_id:
-                    continue
-                app_url = f"https://store.steampowered.com/app/{app_id}"
-                a_tag = div.select_one(".recommmendation_app_small_cap_ctn a")
-                game_title = a_tag['href'].split('/')[5].replace('_', ' ') if a_tag else f"App ID {app_id}"
-                desc_tag = div.find("div", class_="recommendation_desc")
-                blurb = desc_tag.get_text(strip=True) if desc_tag else "No review text."
-                if div.find("span", class_="color_recommended"):
-                    verdict = "✅ Recommended"
-                elif div.find("span", class_="color_not_recommended"):
-                    verdict = "❌ Not Recommended"
-                elif div.find("span", class_="color_informational"):
-                    verdict = "🧠 Informational"
-                else:
-                    verdict = "🧠 Informational"
-                temp_reviews.append({
-                    "game": game_title,
-                    "blurb": blurb,
-                    "verdict": verdict,
-                    "url": app_url
-                })
-            start += count
-    curator_reviews.extend(temp_reviews)
-    async with aiofiles.open(REVIEW_JSON_PATH, "w", encoding="utf-8") as f:
-        await f.write(json.dumps(curator_reviews, indent=2, ensure_ascii=False))
+        start = starts[-1] + CURATOR_PAGE_SIZE
+        if report:
+            report(f"{len(fetched)} reviews from {start // CURATOR_PAGE_SIZE} pages")
+    changed = [r for r in fetched if review_store.get(r.url) != r]
+    if full and reached_end:
+        await review_store.replace_all(fetched)
+    elif changed:
+        await review_store.update(changed)
+    return len(changed)
+
+curator_sync_lock = asyncio.Lock()
+
+async def run_curator_sync(flight, full):
+    # Same-mode syncs coalesce through single flight; a full and an incremental one still take turns on the store
+    async with curator_sync_lock:
+        return await asyncio.wait_for(fetch_and_save_curator_reviews(full, flight.report), CURATOR_SYNC_DEADLINE)
+
+def start_curator_sync(full=False):
+    return start_flight(("curator_sync", full), lambda flight: run_curator_sync(flight, full))
+
+async def run_curator_sync_schedule():
+    while True:
+        await asyncio.sleep(CURATOR_SYNC_INTERVAL + random.uniform(-CURATOR_SYNC_JITTER, CURATOR_SYNC_JITTER))
+        try:
+            flight, _ = start_curator_sync()
+            await asyncio.shield(flight.task)
+        except Exception:
+            logging.exception("Scheduled curator review sync failed")
 
 async def load_curator_reviews():
-    global curator_reviews
     try:
-        async with aiofiles.open(REVIEW_JSON_PATH, "r", encoding="utf-8") as f:
-            content = await f.read()
-            curator_reviews = json.loads(content)
+        await review_store.load()
     except Exception:
-        curator_reviews = []
+        logging.exception("Failed to load curator reviews")
+
+# ======= Warm-up =======
+# on_ready רץ שוב אחרי כל ריקונקט לגייטווי, אז הכל פה קורה פעם אחת לכל תהליך.
+# קודם עולה הסנאפשוט מהריצה הקודמת כדי שהטריגרים יעבדו מיד, ואז הסקרייפרים מרעננים אותו ברקע
+WARMUP_SNAPSHOT_VERSION = 1
+warmup_started = False
+warmup_task = None
+
+async def load_warmup_snapshot():
+    global gacha_games, fish_list
+    try:
+        async with aiofiles.open(WARMUP_SNAPSHOT_PATH, "r", encoding="utf-8") as f:
+            snapshot = json.loads(await f.read())
+    except Exception:
+        return
+    if snapshot.get("version") != WARMUP_SNAPSHOT_VERSION:
+        return
+    gacha_games = snapshot.get("gacha_games", [])
+    fish_list = snapshot.get("fish_list", [])
+
+async def save_warmup_snapshot():
+    snapshot = {
+        "version": WARMUP_SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "gacha_games": gacha_games,
+        "fish_list": fish_list
+    }
+    tmp_path = WARMUP_SNAPSHOT_PATH + ".tmp"
+    async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+        await f.write(json.dumps(snapshot, ensure_ascii=False))
+    os.replace(tmp_path, WARMUP_SNAPSHOT_PATH)
+
+async def refresh_scraped_lists():
+    global gacha_games, fish_list
+    wiki, fandom, fish = await asyncio.gather(
+        fetch_wikipedia_gacha_games(),
+        fetch_fandom_gacha_games(),
+        fetch_fish_list(),
+        return_exceptions=True
+    )
+    for name, result in (("wikipedia", wiki), ("fandom", fandom), ("fish", fish)):
+        if isinstance(result, BaseException):
+            logging.warning("Warm-up scrape %s failed: %r", name, result)
+    # A failed or empty scrape keeps the last good list instead of wiping it
+    changed = False
+    if isinstance(wiki, list) and isinstance(fandom, list) and (wiki or fandom):
+        gacha_games = wiki + fandom
+        changed = True
+    if isinstance(fish, list) and fish:
+        fish_list = fish
+        changed = True
+    if changed:
+        await save_warmup_snapshot()
+
+# ======= Shared State =======
+# בקלאסטרים רק המוביל מסנכרן ביקורות וסורק רשימות, השאר רק שמים לב שהקבצים השתנו וטוענים אותם מחדש
+shared_state_task = None
+# Stamped right before the preloads read the files, a write that lands between the preload and the
+# watcher's first poll (on_ready comes a few seconds later) still counts as a change
+shared_state_stamps = {}
+
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def shared_state_sources():
+    return [
+        (REVIEW_STORE_PATH, review_store.load),
+        (WARMUP_SNAPSHOT_PATH, load_warmup_snapshot),
+        (MEDIA_MANIFEST_PATH, load_media_manifest)
+    ]
+
+def stamp_shared_state():
+    shared_state_stamps.update((path, file_stamp(path)) for path, _ in shared_state_sources())
+
+async def run_shared_state_watch():
+    sources = shared_state_sources()
+    stamps = {path: shared_state_stamps[path] if path in shared_state_stamps else file_stamp(path) for path, _ in sources}
+    while True:
+        await asyncio.sleep(SHARED_STATE_POLL)
+        for path, reload in sources:
+            stamp = file_stamp(path)
+            if stamp == stamps[path]:
+                continue
+            stamps[path] = stamp
+            try:
+                await reload()
+            except Exception:
+                logging.exception(f"Reloading shared state from {path} failed")
+
+async def preload_data():
+    stamp_shared_state()
+    await asyncio.gather(load_warmup_snapshot(), load_curator_reviews(), load_theorem_index(), artist_dictionary.load(),
+                         load_media_links(), load_media_manifest(), load_berman_sentences())
+    # After the manifest, so an optimized Sosa list from it wins over the plain listing
+    await load_sosa_files()
+
+def start_preloads():
+    global preload_task
+    if preload_task is None:
+        preload_task = asyncio.create_task(preload_data())
+    return preload_task
+
+async def warm_up():
+    global curator_sync_task, streak_snapshot_task, metrics_task, shared_state_task, loop_lag_task, album_prefetch_task
+    global media_manifest_task
+    metrics_task = asyncio.create_task(run_metrics_exporter())
+    loop_lag_task = asyncio.create_task(run_loop_lag_monitor())
+    streak_snapshot_task = asyncio.create_task(run_streak_snapshots())
+    await asyncio.shield(start_preloads())
+    # The lazy modules get imported off the loop now, so the first fuzzy match or scrape doesn't pay for it
+    await run_in_worker("thread", load_lazy_modules)
+    if CLUSTER_COUNT > 1:
+        shared_state_task = asyncio.create_task(run_shared_state_watch())
+    if not IS_LEADER:
+        return
+    # Every process has its own Discogs bucket while the token's limit is shared, so only the leader prefetches.
+    # Albums asked for on other clusters take the normal path
+    if DISCOGS_TOKEN:
+        album_prefetch_task = asyncio.create_task(run_album_prefetch())
+    curator_sync_task = asyncio.create_task(run_curator_sync_schedule())
+    media_manifest_task = asyncio.create_task(run_media_manifest())
+    await refresh_scraped_lists()
 
 # ======= On Ready =======
 @bot.event
 async def on_ready():
+    global warmup_started, warmup_task
     print(f"Logged in as {bot.user.name}")
-    await fetch_wikipedia_gacha_games()
-    await fetch_fandom_gacha_games()
-    await fetch_fish_list()
-    await load_curator_reviews()
+    if warmup_started:
+        return
+    warmup_started = True
+    warmup_task = asyncio.create_task(warm_up())
 
 # ======= Preloads for Triggers =======
 media_triggers = [
@@ -321,6 +1473,468 @@ def suicide_triggers(msg): #דניאל נמ מצא את זה (בטעות) ב10.5
         ("kys" in msg) or ("kms" in msg) or \
         ("תתאבד" in msg) or ("יתאבד" in msg) or ("התאבד" in msg)
 
+text_triggers = [
+    (["מה אומר דוד"], ("send", "https://www.the-importer.co.il/cdn-cgi/image/format=auto,metadata=none,quality=85,fit=pad/media/catalog/product/4/7/4750021000805.jpg")), # אני בטעות חשפתי את זה ב4.5
+    (["holy fuck"], ("send", "https://www.ginotpeershop.co.il/images/logos/2/WhatsApp9_11zon_(1).png")), # דניאל נמ מצא את זה ב30.4
+    (["stunna", "סטאנה"], ("send", "https://tenor.com/view/stunnaboy-stunnaboy-get-em-pretty-boy-swag-stunna-dance-stunna-gif-19367307")), #ולדי היה האחד שביקש את זה ואיכשהו עדיין לא הפעילו את זה עד עכשיו
+    (["נאפו"], ("reply", "בנאפו?! מי מציג בנאפו??")),
+]
+
+# מדיה קודם ואז טקסט, אותו סדר כמו שהיה עם ה-ifים
+trigger_pattern = None
+howard_pattern = re.compile(r"\bhoward\b", re.IGNORECASE)
+
+# ======= Mention & Author Rules =======
+# כל האיסטר אגים של התיוגים בטבלה אחת. מוסיפים שורה פה במקום עוד if בתוך on_message
+# priority נמוך מנצח. stop=False ממשיך אחר כך ל-process_commands כמו שהיה עם ברמן
+MentionRule = namedtuple(
+    "MentionRule",
+    ["name", "priority", "action", "mention", "author", "keywords", "word", "skip_replies", "stop"],
+    defaults=(None, None, (), None, False, True)
+)
+
+# snake, dino and walter share a priority: like the old loop over message.mentions, the first one mentioned wins
+mention_rules = [
+    MentionRule("snake", 10, ("reply", "אה סנקי"), mention=168329788325363712, skip_replies=True), # האיסטר אג הראשון שגילו. ע"י אבירם ב25.4
+    MentionRule("dino", 10, ("reply", "https://hebrew-academy.org.il/keyword/%D7%91%D6%BC%D6%B9%D7%94%D6%B6%D7%9F/"), mention=201051167084642304, skip_replies=True), # אם מתייגים את דינו
+    MentionRule("walter", 10, ("send", "https://upload.wikimedia.org/wikipedia/en/0/03/Walter_White_S5B.png"), mention=343667951959932940, skip_replies=True), # אם מתייגים את סוריקטה, למרות שאני די בטוח שזה משום מה לא עובד חחחחחח
+    # שולח משחק גאצ'ה רנדומלי אם מתייגים את יאן ורושמים משהו המכיל את המילה גון או גונר בשני השפות
+    MentionRule("gacha", 20, ("reply_random", "gacha_games", " קח משחק גאצ'ה רנדומלי: **{}**"), mention=280755361596702721, keywords=("goon", "גונ", "גון")),
+    # האיסטר אג של קרליק, האחד שעבדתם עליו כל כך קשה. שולח דג רנדומלי אם מתייגים את קרליק ורושמים פיש בשני השפות
+    MentionRule("fish", 30, ("reply_random", "fish_list", "🐟 Here's a fish for you: {}", {"suppress_embeds": True}), mention=473100047849095168, keywords=("fish", "פיש", "דג")),
+    # אבירם מצא את זה ב29.4
+    MentionRule("howard", 40, ("send_file", "howard.png"), mention=258938288684007424, word=howard_pattern),
+    # זה אחד מיוחד - כל פעם שרפאל ברמן מתייג את דניאל נמ זה שולח משפט רנדומלי מרשימה קצרה, אבל איכשהו מאז היום שעשיתי לאפדייט פוש ברמן פשוט הפסיק
+    MentionRule("berman", 50, ("send_random", "berman_sentences", "{}"), mention=290380573124591627, author=334649464750866433, stop=False),
+]
+
+mention_rule_index = {}  # mentioned user ID -> rules
+author_rule_index = {}  # author ID -> rules that don't need a mention
+word_rules = []  # rules that can also fire on a word without the mention
+
+def reload_triggers():
+    global trigger_pattern
+    trigger_pattern = compile_triggers(media_triggers + text_triggers)
+    mention_rule_index.clear()
+    author_rule_index.clear()
+    word_rules.clear()
+    for rule in sorted(mention_rules, key=lambda r: r.priority):
+        if rule.mention is not None:
+            mention_rule_index.setdefault(rule.mention, []).append(rule)
+        elif rule.author is not None:
+            author_rule_index.setdefault(rule.author, []).append(rule)
+        if rule.word is not None:
+            word_rules.append(rule)
+
+reload_triggers()
+
+def rule_applies(rule, message, msg):
+    if rule.author is not None and message.author.id != rule.author:
+        return False
+    if rule.skip_replies and message.reference:
+        return False
+    return not rule.keywords or any(k in msg for k in rule.keywords)
+
+def match_mention_rule(message, msg):
+    best = None
+    for user in message.mentions:
+        for rule in mention_rule_index.get(user.id, ()):
+            if best is not None and rule.priority >= best.priority:
+                break
+            if rule_applies(rule, message, msg):
+                best = rule
+                break
+    for rule in author_rule_index.get(message.author.id, ()):
+        if best is not None and rule.priority >= best.priority:
+            break
+        if rule_applies(rule, message, msg):
+            best = rule
+            break
+    for rule in word_rules:
+        if best is not None and rule.priority >= best.priority:
+            break
+        if rule.word.search(msg) and rule_applies(rule, message, msg):
+            best = rule
+            break
+    return best
+
+async def run_mention_rule(rule, message):
+    kind = rule.action[0]
+    if kind == "reply":
+        await message.reply(rule.action[1])
+    elif kind == "send":
+        await message.channel.send(rule.action[1])
+    elif kind == "send_file":
+        await send_file(message.channel, rule.action[1])
+    else:
+        # The lists get swapped out on refresh, so they're looked up by name every time
+        choices = globals()[rule.action[1]]
+        if not choices:
+            return
+        text = rule.action[2].format(random.choice(choices))
+        kwargs = rule.action[3] if len(rule.action) > 3 else {}
+        if kind == "reply_random":
+            await message.reply(text, **kwargs)
+        else:
+            await message.channel.send(text, **kwargs)
+
+# ======= Media Cache =======
+media_cache = OrderedDict()  # path -> (mtime, size, bytes), oldest first
+media_cache_bytes = 0
+media_cache_stats = {"hits": 0, "misses": 0, "streamed": 0, "linked": 0}
+
+async def media_file(filename, name=None):
+    global media_cache_bytes
+    st = os.stat(filename)
+    name = name or os.path.basename(filename)
+    # Big videos go straight from disk, discord.py reads the open handle while uploading
+    if st.st_size > MEDIA_CACHE_MAX_FILE_BYTES:
+        stale = media_cache.pop(filename, None)
+        if stale:
+            media_cache_bytes -= len(stale[2])
+        media_cache_stats["streamed"] += 1
+        return discord.File(filename, filename=name)
+
+    entry = media_cache.get(filename)
+    if entry and entry[0] == st.st_mtime and entry[1] == st.st_size:
+        media_cache.move_to_end(filename)
+        media_cache_stats["hits"] += 1
+        return discord.File(io.BytesIO(entry[2]), filename=name)
+
+    media_cache_stats["misses"] += 1
+    async with aiofiles.open(filename, "rb") as f:
+        data = await f.read()
+    # Looked up again: another send of the same file may have filled the slot while this one was reading
+    entry = media_cache.get(filename)
+    if entry:
+        media_cache_bytes -= len(entry[2])
+    media_cache[filename] = (st.st_mtime, st.st_size, data)
+    media_cache.move_to_end(filename)
+    media_cache_bytes += len(data)
+    while media_cache_bytes > MEDIA_CACHE_MAX_BYTES and media_cache:
+        _, (_, _, old) = media_cache.popitem(last=False)
+        media_cache_bytes -= len(old)
+    return discord.File(io.BytesIO(data), filename=name)
+
+# ======= Attachment Links =======
+# אחרי שקובץ עלה פעם אחת לדיסקורד שומרים את הלינק של הצרופה (לפי ההאש של התוכן) ושולחים אותו במקום להעלות שוב.
+# הלינקים של הסי-די-אן חתומים עם תאריך תפוגה (ex), אז קצת לפניו או כשהקובץ משתנה פשוט מעלים מחדש
+MEDIA_LINK_TTL = 12 * 3600  # for URLs without an ex= expiry
+MEDIA_LINK_MARGIN = 3600
+media_hashes = {}  # path -> (mtime_ns, size, sha256)
+media_links = {}  # sha256 -> (url, expires)
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def media_hash(filename):
+    st = os.stat(filename)
+    entry = media_hashes.get(filename)
+    if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+        return entry[2]
+    digest = await run_in_worker("thread", hash_file, filename)
+    media_hashes[filename] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+def attachment_expiry(url):
+    ex = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query).get("ex")
+    try:
+        return int(ex[0], 16)
+    except (TypeError, ValueError):
+        return time.time() + MEDIA_LINK_TTL
+
+def media_link(digest):
+    link = media_links.get(digest)
+    if link and link[1] - MEDIA_LINK_MARGIN > time.time():
+        return link[0]
+    return None
+
+async def load_media_links():
+    global media_links
+    try:
+        async with aiofiles.open(MEDIA_LINKS_PATH, "r", encoding="utf-8") as f:
+            saved = json.loads(await f.read())
+    except Exception:
+        return
+    media_links = {digest: tuple(link) for digest, link in saved.items()}
+
+async def save_media_links():
+    now = time.time()
+    for digest in [d for d, (_, expires) in media_links.items() if expires <= now]:
+        del media_links[digest]
+    tmp_path = MEDIA_LINKS_PATH + ".tmp"
+    async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+        await f.write(json.dumps(media_links))
+    os.replace(tmp_path, MEDIA_LINKS_PATH)
+
+async def remember_media_link(digest, message):
+    attachments = getattr(message, "attachments", None)
+    if not attachments:
+        return
+    url = attachments[0].url
+    media_links[digest] = (url, attachment_expiry(url))
+    await save_media_links()
+
+# ======= Media Manifest =======
+# כל המדיה (סוסה וקבצי הטריגרים) עם האש, גודל ומידות, ולתמונות גרסה מוקטנת/מקודדת מחדש בתיקיית הקאש.
+# בנייה מחדש נוגעת רק בקבצים שהשתנו, והוריאנטים נקראים לפי ההאש אז אותו תוכן לא מקודד פעמיים
+MEDIA_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp4', '.mov')
+MEDIA_VARIANT_EXTENSIONS = ('.png', '.jpg', '.jpeg')  # gifs stay as they are so they keep animating
+MEDIA_MAX_DIMENSION = int(os.getenv("MEDIA_MAX_DIMENSION", 1600))
+MEDIA_VARIANT_MAX_BYTES = int(os.getenv("MEDIA_VARIANT_MAX_BYTES", 1024 * 1024))
+MEDIA_JPEG_QUALITY = 85
+MEDIA_VARIANT_MIN_SAVING = 0.9  # a variant has to be under 90% of the original to be worth serving
+MEDIA_MANIFEST_INTERVAL = 600
+MEDIA_VARIANT_NAME = re.compile(r"[0-9a-f]{16}\.(?:jpg|png)")  # what optimize_image writes, the only files cleanup may delete
+media_manifest = {}  # normalized path -> entry, see build_media_manifest
+media_manifest_task = None
+
+def media_key(path):
+    return os.path.normpath(path)
+
+def optimize_image(path, digest):
+    # Returns (width, height, variant path or None). Images with transparency stay PNG, the rest become JPEG,
+    # and the longest side is shrunk until the variant fits MEDIA_VARIANT_MAX_BYTES
+    with Image.open(path) as im:
+        width, height = im.size
+        if not path.lower().endswith(MEDIA_VARIANT_EXTENSIONS):
+            return width, height, None
+        has_alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+        img = im.convert("RGBA" if has_alpha else "RGB")
+    # Lots of screenshots carry an alpha channel that's fully opaque, those can be JPEGs too
+    if has_alpha and img.getchannel("A").getextrema() == (255, 255):
+        has_alpha = False
+        img = img.convert("RGB")
+    ext = ".png" if has_alpha else ".jpg"
+    variant = os.path.join(MEDIA_CACHE_DIR, f"{digest[:16]}{ext}")
+    if os.path.exists(variant):
+        return width, height, variant
+    max_side = MEDIA_MAX_DIMENSION
+    while True:
+        candidate = img.copy()
+        candidate.thumbnail((max_side, max_side))
+        buf = io.BytesIO()
+        if has_alpha:
+            candidate.save(buf, "PNG", optimize=True)
+        else:
+            candidate.save(buf, "JPEG", quality=MEDIA_JPEG_QUALITY, optimize=True, progressive=True)
+        if buf.tell() <= MEDIA_VARIANT_MAX_BYTES or max_side <= 400:
+            break
+        max_side = int(max_side * 0.75)
+    if buf.tell() >= os.path.getsize(path) * MEDIA_VARIANT_MIN_SAVING:
+        return width, height, None
+    tmp_path = variant + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buf.getvalue())
+    os.replace(tmp_path, variant)
+    return width, height, variant
+
+def build_media_manifest(dirs, previous):
+    # Runs in a worker process. Only files whose mtime/size changed (or whose variant vanished) are hashed again
+    os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+    manifest = {}
+    for folder in dirs:
+        try:
+            names = sorted(os.listdir(folder))
+        except OSError:
+            continue
+        for name in names:
+            path = media_key(os.path.join(folder, name))
+            if not name.lower().endswith(MEDIA_EXTENSIONS) or not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            old = previous.get(path)
+            if (old and old["mtime_ns"] == st.st_mtime_ns and old["size"] == st.st_size
+                    and (not old["variant"] or os.path.exists(old["variant"]))):
+                manifest[path] = old
+                continue
+            digest = hash_file(path)
+            entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest,
+                     "width": None, "height": None, "variant": None, "variant_size": None}
+            if HAS_PIL and not name.lower().endswith(('.mp4', '.mov')):
+                try:
+                    entry["width"], entry["height"], entry["variant"] = optimize_image(path, digest)
+                except Exception:
+                    logging.exception(f"Optimizing {path} failed")
+                if entry["variant"]:
+                    entry["variant_size"] = os.path.getsize(entry["variant"])
+            manifest[path] = entry
+    # Variants of files that were changed or removed. Anything else in the folder (the manifest, another build's
+    # .tmp files, subfolders) is left alone
+    used = {entry["variant"] for entry in manifest.values() if entry["variant"]}
+    for name in os.listdir(MEDIA_CACHE_DIR):
+        path = os.path.join(MEDIA_CACHE_DIR, name)
+        if MEDIA_VARIANT_NAME.fullmatch(name) and path not in used:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    tmp_path = MEDIA_MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, MEDIA_MANIFEST_PATH)
+    return manifest
+
+def apply_media_manifest(manifest):
+    global media_manifest, sosa_files
+    media_manifest = manifest
+    sosa_key = media_key(sosa_folder)
+    sosa = [path for path in manifest if os.path.dirname(path) == sosa_key and path.lower().endswith(SOSA_EXTENSIONS)]
+    if sosa:
+        sosa_files = sosa
+
+async def load_media_manifest():
+    try:
+        async with aiofiles.open(MEDIA_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            manifest = json.loads(await f.read())
+    except Exception:
+        return
+    apply_media_manifest(manifest)
+
+async def run_media_manifest():
+    while True:
+        try:
+            apply_media_manifest(await run_in_worker("process", build_media_manifest, MEDIA_DIRS, media_manifest))
+        except Exception:
+            logging.exception("Building the media manifest failed")
+        await asyncio.sleep(MEDIA_MANIFEST_INTERVAL)
+
+def media_variant(filename):
+    # The variant is only served while the original is still the file it was built from
+    entry = media_manifest.get(media_key(filename))
+    if not entry or not entry["variant"]:
+        return filename
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return filename
+    if st.st_mtime_ns != entry["mtime_ns"] or st.st_size != entry["size"] or not os.path.exists(entry["variant"]):
+        return filename
+    return entry["variant"]
+
+# ======= Yap Streaks =======
+# פעם זה היה defaultdict שפשוט גדל לנצח. עכשיו יש תקרה על מספר הערוצים, ערוץ שלא דיברו בו מספיק זמן נזרק,
+# והמצב נשמר ל-SQLite כדי שדיפלוי לא יאפס למישהו את הרצף ושכל הקלאסטרים יכתבו לאותו מקום
+STREAK_MAX_CHANNELS = 5000
+STREAK_TTL = 6 * 3600
+STREAK_SNAPSHOT_INTERVAL = 60
+YAP_LIMIT = 7
+
+class Streak:
+    __slots__ = ("last_user", "count", "last_seen")
+
+    def __init__(self, last_user=None, count=0, last_seen=0.0):
+        self.last_user = last_user
+        self.count = count
+        self.last_seen = last_seen
+
+class StreakTracker:
+    # The OrderedDict is kept in last-seen order, so both TTL expiry and LRU eviction pop from the front
+    def __init__(self, max_channels=STREAK_MAX_CHANNELS, ttl=STREAK_TTL):
+        self.max_channels = max_channels
+        self.ttl = ttl
+        self.streaks = OrderedDict()
+        self.dirty = set()
+
+    def __len__(self):
+        return len(self.streaks)
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        while self.streaks:
+            channel_id, streak = next(iter(self.streaks.items()))
+            if now - streak.last_seen <= self.ttl:
+                break
+            del self.streaks[channel_id]
+            self.dirty.discard(channel_id)
+
+    def record(self, channel_id, author_id, now=None):
+        now = time.time() if now is None else now
+        self.expire(now)
+        streak = self.streaks.get(channel_id)
+        if streak is None:
+            streak = self.streaks[channel_id] = Streak()
+            while len(self.streaks) > self.max_channels:
+                # A dropped channel has nothing left to snapshot, keeping it in dirty would grow the set without bound
+                self.dirty.discard(self.streaks.popitem(last=False)[0])
+        else:
+            self.streaks.move_to_end(channel_id)
+        if streak.last_user == author_id:
+            streak.count += 1
+        else:
+            streak.last_user = author_id
+            streak.count = 1
+        streak.last_seen = now
+        self.dirty.add(channel_id)
+        return streak.count
+
+    def reset(self, channel_id):
+        streak = self.streaks.get(channel_id)
+        if streak:
+            streak.last_user = None
+            streak.count = 0
+            self.dirty.add(channel_id)
+
+    def take_dirty(self):
+        # Rows are copied on the event loop so the write can happen in a thread without racing record()
+        dirty, self.dirty = self.dirty, set()
+        return [(c, s.last_user, s.count, s.last_seen) for c in dirty if (s := self.streaks.get(c))]
+
+    def write(self, path, rows):
+        db = sqlite3.connect(path, timeout=10)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS streaks "
+                "(channel_id INTEGER PRIMARY KEY, last_user INTEGER, count INTEGER NOT NULL, last_seen REAL NOT NULL)"
+            )
+            with db:
+                db.executemany("INSERT OR REPLACE INTO streaks VALUES (?, ?, ?, ?)", rows)
+                db.execute("DELETE FROM streaks WHERE last_seen < ?", (time.time() - self.ttl,))
+        finally:
+            db.close()
+
+    def save(self, path):
+        rows = self.take_dirty()
+        if rows:
+            self.write(path, rows)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            db = sqlite3.connect(path, timeout=10)
+            try:
+                rows = db.execute(
+                    "SELECT channel_id, last_user, count, last_seen FROM streaks WHERE last_seen >= ? "
+                    "ORDER BY last_seen DESC LIMIT ?", (time.time() - self.ttl, self.max_channels)
+                ).fetchall()
+            finally:
+                db.close()
+        except sqlite3.Error:
+            return
+        self.streaks.clear()
+        for channel_id, last_user, count, last_seen in reversed(rows):
+            self.streaks[channel_id] = Streak(last_user, count, last_seen)
+
+message_streaks = StreakTracker()
+streak_snapshot_task = None
+
+async def run_streak_snapshots():
+    while True:
+        await asyncio.sleep(STREAK_SNAPSHOT_INTERVAL)
+        try:
+            message_streaks.expire()
+            rows = message_streaks.take_dirty()
+            if rows:
+                await asyncio.to_thread(message_streaks.write, STREAK_SNAPSHOT_PATH, rows)
+        except Exception:
+            logging.exception("Saving yap streaks failed")
+
 #דיבאג שהאמת פשוט שכחתי להוריד מהקוד המלא
 async def send_file(destination, filename, reply=False):
     if not os.path.exists(filename):
@@ -329,17 +1943,35 @@ async def send_file(destination, filename, reply=False):
         elif hasattr(destination, "send"):
             await destination.send(f"⚠️ File `{filename}` not found.")
         return
-    async with aiofiles.open(filename, "rb") as f:
-        data = await f.read()
-        file = discord.File(io.BytesIO(data), filename=os.path.basename(filename))
-        if reply and hasattr(destination, "reply"):
-            await destination.reply(file=file)
-        elif hasattr(destination, "send"):
-            await destination.send(file=file)
+    served = media_variant(filename)
+    digest = await media_hash(served)
+    link = media_link(digest)
+    if link:
+        media_cache_stats["linked"] += 1
+        kwargs = {"content": link}
+    else:
+        # Keep the original name, only the extension follows the variant (a PNG may have become a JPEG)
+        name = os.path.splitext(os.path.basename(filename))[0] + os.path.splitext(served)[1]
+        kwargs = {"file": await media_file(served, name)}
+    if reply and hasattr(destination, "reply"):
+        message = await destination.reply(**kwargs)
+    elif hasattr(destination, "send"):
+        message = await destination.send(**kwargs)
+    else:
+        return
+    if not link:
+        await remember_media_link(digest, message)
 
 # ======= On Message - טריגרים להודעות =======
 @bot.event
 async def on_message(message):
+    start = time.perf_counter()
+    try:
+        await handle_message(message)
+    finally:
+        metrics_observe("handler", "on_message", time.perf_counter() - start)
+
+async def handle_message(message):
     if message.author == bot.user or message.author.bot:
         return
 
@@ -350,115 +1982,484 @@ async def on_message(message):
     # --- Yap Counter ---
     #אבירם גיימינג הפעיל את זה ב10.5, 3 דקות אחרי שעשיתי פוש לאפדייט...
     if message.content.startswith(bot.command_prefix):
-        message_streaks[channel_id]["last_user"] = None
-        message_streaks[channel_id]["count"] = 0
+        message_streaks.reset(channel_id)
         await bot.process_commands(message)
         return
 
-    if message_streaks[channel_id]["last_user"] == author_id:
-        message_streaks[channel_id]["count"] += 1
-    else:
-        message_streaks[channel_id]["last_user"] = author_id
-        message_streaks[channel_id]["count"] = 1
-    if message_streaks[channel_id]["count"] == 7:
-        async with aiofiles.open("yap.gif", "rb") as f:
-            data = await f.read()
-            file = discord.File(io.BytesIO(data), filename="yap.gif")
-            await message.channel.send(
-                content=f"{message.author.mention} Shut the hell up",
-                file=file
-            )
-        message_streaks[channel_id]["count"] = 0
+    if message_streaks.record(channel_id, author_id) == YAP_LIMIT:
+        file = await media_file("yap.gif")
+        await timed_trigger("yap", message.channel.send(
+            content=f"{message.author.mention} Shut the hell up",
+            file=file
+        ))
+        message_streaks.reset(channel_id)
         return
 
 
 
     # NEVER KILL YOURSELF trigger
     if suicide_triggers(msg):
-        await send_file(message, "nkyss.mp4", reply=True)
+        await timed_trigger("nkyss", send_file(message, "nkyss.mp4", reply=True))
         return
 
-    # Media triggers
-    for keywords, filename in media_triggers:
-        if any(word_in_text(w, msg) for w in keywords):
-            await send_file(message.channel, filename)
+    # Media triggers + custom triggers, one pass over the message
+    hit = match_trigger(trigger_pattern, msg)
+    if hit is not None and hit < len(media_triggers):
+        filename = media_triggers[hit][1]
+        await timed_trigger(filename, send_file(message.channel, filename))
+        return
+    if hit is not None:
+        keywords, (kind, content) = text_triggers[hit - len(media_triggers)]
+        if kind == "reply":
+            await timed_trigger(keywords[0], message.reply(content))
+        else:
+            await timed_trigger(keywords[0], message.channel.send(content))
+
+    # תיוגים
+    rule = match_mention_rule(message, msg)
+    if rule:
+        await timed_trigger(rule.name, run_mention_rule(rule, message))
+        if rule.stop:
             return
 
-    # Custom triggers
-    if word_in_text("מה אומר דוד", msg): # אני בטעות חשפתי את זה ב4.5
-        await message.channel.send("https://www.the-importer.co.il/cdn-cgi/image/format=auto,metadata=none,quality=85,fit=pad/media/catalog/product/4/7/4750021000805.jpg")
+    await bot.process_commands(message)
 
-    elif word_in_text("holy fuck", msg): # דניאל נמ מצא את זה ב30.4
-        await message.channel.send("https://www.ginotpeershop.co.il/images/logos/2/WhatsApp9_11zon_(1).png")
+# ======= Theorems =======
+# הרשימה של mishpat נטענת פעם אחת לאינדקס לפי ID, ונטענת מחדש רק כשהקובץ משתנה
+THEOREM_RELOAD_CHECK = 30
+theorem_index = {}
+theorem_ids = []
+theorem_state = {"mtime": None, "checked": 0.0, "reload": None}
+
+def parse_theorems(content):
+    index = {}
+    for entry in content.strip().split("\n\n"):
+        lines = entry.strip().split("\n")
+        raw_id = lines[0].replace("ID:", "").strip("[] ").zfill(3)
+        index[raw_id] = "\n".join(lines[1:])
+    return index
+
+async def load_theorem_index():
+    global theorem_index, theorem_ids
+    theorem_state["checked"] = time.monotonic()
+    try:
+        mtime = os.stat(THEOREM_PATH).st_mtime
+    except OSError:
+        return
+    if mtime == theorem_state["mtime"]:
+        return
+    async with aiofiles.open(THEOREM_PATH, "r", encoding="utf-8") as f:
+        content = await f.read()
+    index = parse_theorems(content)
+    theorem_index, theorem_ids = index, list(index)
+    theorem_state["mtime"] = mtime
+
+async def get_theorem_index():
+    if not theorem_index:
+        await load_theorem_index()
+    elif time.monotonic() - theorem_state["checked"] > THEOREM_RELOAD_CHECK:
+        # The mtime check runs in the background, this pick is served from what's already loaded
+        reload_task = theorem_state["reload"]
+        if reload_task is None or reload_task.done():
+            theorem_state["reload"] = asyncio.create_task(load_theorem_index())
+    return theorem_index
+
+# ======= Discogs Catalogue =======
+# אינדקס מקומי מהדאמפ החודשי של דיסקוגס (python Mika.py ingest-discogs discogs_masters.xml.gz),
+# ככה הבחירה הרנדומלית היא באמת אחידה על כל האלבומים שמתאימים לפילטר ולא רק על 15 תוצאות חיפוש.
+# seq הוא מספור רציף של המאסטרים כדי שבלי פילטר אפשר להגריל מספר ולקפוץ ישר לשורה
+DISCOGS_INDEX_BATCH = 10000
+DISCOGS_INDEX_SCHEMA = """
+CREATE TABLE masters (seq INTEGER PRIMARY KEY, id INTEGER NOT NULL, title TEXT, artist TEXT,
+                      year INTEGER, genres TEXT, styles TEXT);
+CREATE TABLE master_tags (tag TEXT NOT NULL, seq INTEGER NOT NULL, PRIMARY KEY (tag, seq)) WITHOUT ROWID;
+CREATE TABLE master_artists (artist TEXT NOT NULL, seq INTEGER NOT NULL, PRIMARY KEY (artist, seq)) WITHOUT ROWID;
+CREATE TABLE meta (key TEXT PRIMARY KEY, value INTEGER);
+"""
+
+def normalize_artist(name):
+    name = clean_discogs_artist(name).lower()
+    name = re.sub(r"^the\s+", "", name)
+    # Names made only of punctuation ("!!!") keep their punctuation instead of collapsing to ""
+    return re.sub(r"[\W_]+", "", name) or name
+
+def master_artist_credit(artists):
+    credit = ""
+    for i, (name, join) in enumerate(artists):
+        credit += name
+        if i < len(artists) - 1:
+            credit += f" {join} " if join and join != "," else ", "
+    return credit
+
+def build_discogs_index(dump_path, index_path=DISCOGS_INDEX_PATH):
+    # iterparse + root.clear() keeps memory flat no matter how big the dump is.
+    # The index is built next to the old one and swapped in, so the bot keeps reading the old one meanwhile
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    db.execute("PRAGMA journal_mode=OFF")
+    db.execute("PRAGMA synchronous=OFF")
+    db.executescript(DISCOGS_INDEX_SCHEMA)
+    masters, tags, artists = [], [], []
+
+    def flush():
+        db.executemany("INSERT INTO masters VALUES (?, ?, ?, ?, ?, ?, ?)", masters)
+        db.executemany("INSERT OR IGNORE INTO master_tags VALUES (?, ?)", tags)
+        db.executemany("INSERT OR IGNORE INTO master_artists VALUES (?, ?)", artists)
+        masters.clear()
+        tags.clear()
+        artists.clear()
+
+    seq = 0
+    opener = gzip.open if dump_path.endswith(".gz") else open
+    with opener(dump_path, "rb") as f:
+        context = ElementTree.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or elem.tag != "master":
+                continue
+            seq += 1
+            credits = [(a.findtext("name") or "", (a.findtext("join") or "").strip()) for a in elem.iterfind("artists/artist")]
+            genres = [g.text for g in elem.iterfind("genres/genre") if g.text]
+            styles = [s.text for s in elem.iterfind("styles/style") if s.text]
+            year = int(elem.findtext("year") or 0) or None
+            masters.append((seq, int(elem.get("id")), elem.findtext("title"), master_artist_credit(credits),
+                            year, ", ".join(genres), ", ".join(styles)))
+            tags.extend((tag.lower(), seq) for tag in genres + styles)
+            artists.extend((normalize_artist(name), seq) for name, _ in credits if name)
+            root.clear()
+            if len(masters) >= DISCOGS_INDEX_BATCH:
+                flush()
+    flush()
+    db.execute("CREATE INDEX masters_year ON masters (year, seq)")
+    db.execute("INSERT INTO meta VALUES ('masters', ?)", (seq,))
+    db.commit()
+    db.close()
+    os.replace(tmp_path, index_path)
+    return seq
+
+# (table, column) of every filter, in the order they're tried as the driving index - most selective first
+LOCAL_MASTER_FILTERS = (("master_artists", "artist"), ("masters", "year"), ("master_tags", "tag"))
+
+def pick_local_master(attempt, year):
+    # Same shape as a /database/search result so resolve_album doesn't care where the pick came from.
+    # "style" in the filter is matched against both genres and styles
+    values = {
+        "artist": normalize_artist(attempt["artist"]) if attempt.get("artist") else None,
+        "year": int(year) if year else None,
+        "tag": attempt["style"].strip().lower() if attempt.get("style") else None
+    }
+    filters = [(table, column, values[column]) for table, column in LOCAL_MASTER_FILTERS if values[column] is not None]
+    db = sqlite3.connect(f"file:{DISCOGS_INDEX_PATH}?mode=ro", uri=True)
+    try:
+        if filters:
+            # Walk the index of the first filter and probe the others by primary key,
+            # so COUNT and OFFSET only ever touch the matching entries
+            (table, column, value), rest = filters[0], filters[1:]
+            query = f"FROM {table} d WHERE d.{column} = ?"
+            for other_table, other_column, _ in rest:
+                query += f" AND EXISTS (SELECT 1 FROM {other_table} x WHERE x.seq = d.seq AND x.{other_column} = ?)"
+            args = [value] + [v for _, _, v in rest]
+            count = db.execute(f"SELECT COUNT(*) {query}", args).fetchone()[0]
+            if not count:
+                return None
+            seq = db.execute(f"SELECT d.seq {query} LIMIT 1 OFFSET ?", args + [random.randrange(count)]).fetchone()[0]
+        else:
+            count = db.execute("SELECT value FROM meta WHERE key = 'masters'").fetchone()
+            if not count or not count[0]:
+                return None
+            seq = random.randint(1, count[0])
+        row = db.execute("SELECT id, title, artist, year, genres, styles FROM masters WHERE seq = ?", (seq,)).fetchone()
+    finally:
+        db.close()
+    if not row:
+        return None
+    master_id, title, artist, year, genres, styles = row
+    return {
+        "id": master_id,
+        "title": f"{artist} - {title}" if artist else title,
+        "artist": artist,
+        "year": year,
+        "genre": genres.split(", ") if genres else [],
+        "style": styles.split(", ") if styles else []
+    }
 
-    elif word_in_text("stunna", msg) or word_in_text("סטאנה", msg): #ולדי היה האחד שביקש את זה ואיכשהו עדיין לא הפעילו את זה עד עכשיו
-        await message.channel.send("https://tenor.com/view/stunnaboy-stunnaboy-get-em-pretty-boy-swag-stunna-dance-stunna-gif-19367307")
+# ======= Album Prefetch =======
+# אלבומים מוכנים מראש בשביל h2a album בלי פילטר ובשביל הפילטרים הכי מבוקשים, כל אחד יוצא פעם אחת בלבד.
+# המילוי רץ בעדיפות נמוכה בתור של דיסקוגס, וכשהמאגר ריק או ישן הפקודה פשוט הולכת בדרך הרגילה
+ALBUM_PREFETCH_SIZE = int(os.getenv("ALBUM_PREFETCH_SIZE", 3))
+ALBUM_PREFETCH_FILTERS = int(os.getenv("ALBUM_PREFETCH_FILTERS", 5))
+ALBUM_PREFETCH_TTL = int(os.getenv("ALBUM_PREFETCH_TTL", 1800))
+ALBUM_PREFETCH_INTERVAL = 60
+ALBUM_REQUEST_COUNTS_MAX = 1000
+album_prefetch = defaultdict(deque)  # filter key -> deque of (expires, master_id, embed)
+album_requests = {}  # filter key -> [request count, filters as last typed]
+album_prefetch_wakeup = asyncio.Event()
+album_prefetch_task = None
+
+def album_filter_key(filters):
+    return " ".join(filters.lower().split())
+
+def drop_stale_albums(pool, now=None):
+    now = time.time() if now is None else now
+    while pool and pool[0][0] <= now:
+        pool.popleft()
+
+def take_prefetched_album(filters):
+    key = album_filter_key(filters)
+    entry = album_requests.setdefault(key, [0, filters])
+    entry[0] += 1
+    entry[1] = filters
+    if len(album_requests) > ALBUM_REQUEST_COUNTS_MAX:
+        # Keep the popular half so one-off filters don't pile up forever
+        keep = sorted(album_requests.items(), key=lambda kv: -kv[1][0])[:ALBUM_REQUEST_COUNTS_MAX // 2]
+        album_requests.clear()
+        album_requests.update(keep)
+    album_prefetch_wakeup.set()
+    pool = album_prefetch.get(key)
+    if pool:
+        drop_stale_albums(pool)
+        if pool:
+            metrics_inc("album_prefetch", "hit")
+            return pool.popleft()[2]
+    metrics_inc("album_prefetch", "miss")
+    return None
+
+def album_prefetch_keys():
+    popular = sorted((k for k in album_requests if k), key=lambda k: -album_requests[k][0])
+    return [""] + popular[:ALBUM_PREFETCH_FILTERS]
+
+async def refill_album_pool(key):
+    pool = album_prefetch[key]
+    drop_stale_albums(pool)
+    attempts, year = parse_album_filters(album_requests[key][1] if key in album_requests else key)
+    misses = 0
+    while len(pool) < ALBUM_PREFETCH_SIZE and misses < ALBUM_PREFETCH_SIZE:
+        master_id, embed = await resolve_album(attempts, year, PRIORITY_BACKGROUND)
+        if not embed:
+            return
+        # The search page is cached, so the same master can come up again; it must not be queued twice
+        if any(entry[1] == master_id for entry in pool):
+            misses += 1
+            continue
+        pool.append((time.time() + ALBUM_PREFETCH_TTL, master_id, embed))
 
-    elif word_in_text("נאפו", msg):
-        await message.reply("בנאפו?! מי מציג בנאפו??")
+async def run_album_prefetch():
+    while True:
+        keys = album_prefetch_keys()
+        for key in list(album_prefetch):
+            if key not in keys:
+                del album_prefetch[key]
+        for key in keys:
+            try:
+                await refill_album_pool(key)
+            except Exception:
+                logging.exception(f"Prefetching albums for '{key}' failed")
+        album_prefetch_wakeup.clear()
+        try:
+            await asyncio.wait_for(album_prefetch_wakeup.wait(), timeout=ALBUM_PREFETCH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
 
-    # תיוגים
-    for user in message.mentions:
-        if user.id == 168329788325363712 and not message.reference: # האיסטר אג הראשון שגילו. ע"י אבירם ב25.4
-            await message.reply("אה סנקי")
-            return
-        if user.id == 201051167084642304 and not message.reference: # אם מתייגים את דינו
-            await message.reply("https://hebrew-academy.org.il/keyword/%D7%91%D6%BC%D6%B9%D7%94%D6%B6%D7%9F/")
-            return
-        if user.id == 343667951959932940 and not message.reference: # אם מתייגים את סוריקטה, למרות שאני די בטוח שזה משום מה לא עובד חחחחחח
-            await message.channel.send("https://upload.wikimedia.org/wikipedia/en/0/03/Walter_White_S5B.png")
-            return
+def parse_album_filters(filters):
+    year = None
+    match = re.search(r"\[(.*?)\]", filters)
+    attempts = []
+    if match:
+        parts = [p.strip() for p in match.group(1).split(',') if p.strip()]
+        for part in parts[:]:
+            if part.isdigit() and len(part) == 4:
+                year = part
+                parts.remove(part)
+        if len(parts) == 2:
+            attempts.append({'artist': parts[0], 'style': parts[1]})
+            attempts.append({'style': parts[0], 'artist': parts[1]})
+        elif len(parts) == 1:
+            attempts.append({'style': parts[0]})
+            attempts.append({'artist': parts[0]})
+    if (not attempts or not match) and year:
+        attempts.append({})
+    if not attempts:
+        attempts.append({})
+    return attempts, year
 
-    # שולח משחק גאצ'ה רנדומלי אם מתייגים את יאן ורושמים משהו המכיל את המילה גון או גונר בשני השפות
-    if any(user.id == 280755361596702721 for user in message.mentions) and (
-            'goon' in msg or 'גונ' in msg or 'גון' in msg):
-        if gacha_games:
-            selected_game = random.choice(gacha_games)
-            await message.reply(f" קח משחק גאצ'ה רנדומלי: **{selected_game}**")
-        return
+async def search_discogs_master(attempts, year, priority=None):
+    # Fuzzy resolve artist names using Discogs
+    for attempt in attempts:
+        if 'artist' in attempt and attempt['artist']:
+            attempt['artist'] = await resolve_discogs_artist_name(attempt['artist'], DISCOGS_TOKEN, priority)
 
-    # האיסטר אג של קרליק, האחד שעבדתם עליו כל כך קשה. שולח דג רנדומלי אם מתייגים את קרליק ורושמים פיש בשני השפות
-    if any(user.id == 473100047849095168 for user in message.mentions) and (
-            "fish" in msg or "פיש" in msg or "דג" in msg):
-        if fish_list:
-            selected_fish = random.choice(fish_list)
-            await message.reply(f"🐟 Here's a fish for you: {selected_fish}", suppress_embeds=True)
-        return
+    params_base = []
+    if year: params_base.append(f"year={year}")
+    params_base.append("per_page=15")
+    params_base.append("type=master")
+    params_base.append(f"token={DISCOGS_TOKEN}")
 
-    # אבירם מצא את זה ב29.4
-    if any(user.id == 258938288684007424 for user in message.mentions) or word_in_text("howard", msg):
-        await send_file(message.channel, "howard.png")
-        return
+    for attempt in attempts:
+        params = params_base[:]
+        if 'artist' in attempt: params.append(f"artist={urllib.parse.quote(attempt['artist'])}")
+        if 'style' in attempt: params.append(f"style={urllib.parse.quote(attempt['style'])}")
 
-    # זה אחד מיוחד - כל פעם שרפאל ברמן מתייג את דניאל נמ זה שולח משפט רנדומלי מרשימה קצרה, אבל איכשהו מאז היום שעשיתי לאפדייט פוש ברמן פשוט הפסיק
-    author_id = 334649464750866433
-    target_id = 290380573124591627
-    if message.author.id == author_id and any(user.id == target_id for user in message.mentions):
-        if berman_sentences:
-            selected_sentence = random.choice(berman_sentences)
-            await message.channel.send(selected_sentence)
+        url = f"{DISCOGS_API}/database/search?{'&'.join(params)}"
+        status, data = await cached_get_json(url, priority=priority)
+        if status != 200:
+            continue
+        results = data.get("results", [])
+        if not results:
+            continue
+        return random.choice(results)
+    return None
 
-    await bot.process_commands(message)
+async def resolve_album(attempts, year, priority=None):
+    found_result = None
+    if os.path.exists(DISCOGS_INDEX_PATH):
+        # The local catalogue answers the pick, the API is only needed for the embed details below
+        for attempt in attempts:
+            found_result = await run_in_worker("thread", pick_local_master, attempt, year)
+            if found_result:
+                break
+    if not found_result:
+        found_result = await search_discogs_master(attempts, year, priority)
+    if not found_result or not found_result.get("id"):
+        return None, None
+    master_id = found_result.get("id")
+    master_data = found_result
+    thumb = found_result.get("cover_image")
+
+    details_url = f"{DISCOGS_API}/masters/{master_id}"
+    artist_out = master_data.get("artist") or ""
+    year_out = master_data.get("year") or year or "Unknown Year"
+    genres = ", ".join(master_data.get("genre", []))
+    styles = ", ".join(master_data.get("style", []))
+    title = master_data.get("title", "Unknown Title")
+
+    split_match = re.match(r"(.+?)[–:-]\s+(.+)", title)
+    if split_match:
+        possible_artist, possible_album = split_match.groups()
+        if (not artist_out or re.search(r"\(\d+\)", artist_out) or artist_out.lower() in possible_artist.lower()):
+            artist_out = possible_artist.strip()
+            title = possible_album.strip()
+
+    spotify_url = None
+    spotify_image = None
+    spotify_tracklist = None
+    if SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET:
+        try:
+            spotify_url, spotify_image, spotify_tracklist = await get_spotify_album_url(title, clean_discogs_artist(artist_out))
+        except Exception as e:
+            spotify_url = None
+            spotify_image = None
+            spotify_tracklist = None
+
+    track_str = ""
+    if spotify_tracklist:
+        track_str = "\n".join(spotify_tracklist)
+    else:
+        status, release_data = await cached_get_json(details_url, priority=priority)
+        if status == 200:
+            images = release_data.get("images")
+            if images and images[0].get("uri"):
+                thumb = images[0]["uri"]
+            if "title" in release_data:
+                title = release_data["title"]
+            if "artists" in release_data and release_data["artists"]:
+                artist_out = ", ".join(a["name"] for a in release_data["artists"])
+            if "year" in release_data:
+                year_out = release_data["year"]
+            if "genres" in release_data:
+                genres = ", ".join(release_data["genres"])
+            if "styles" in release_data:
+                styles = ", ".join(release_data["styles"])
+            discogs_tracklist = release_data.get("tracklist", [])
+            local_track_str = ""
+            if discogs_tracklist:
+                for i, t in enumerate(discogs_tracklist, 1):
+                    name = t.get('title', '')
+                    if name:
+                        local_track_str += f"**{i}.** {name}\n"
+            if not local_track_str:
+                main_release_id = release_data.get("main_release")
+                if main_release_id:
+                    release_url = f"{DISCOGS_API}/releases/{main_release_id}"
+                    rel_status, rel_data = await cached_get_json(release_url, priority=priority)
+                    if rel_status == 200:
+                        rel_tracklist = rel_data.get("tracklist", [])
+                        for i, t in enumerate(rel_tracklist, 1):
+                            name = t.get('title', '')
+                            if name:
+                                local_track_str += f"**{i}.** {name}\n"
+            track_str = local_track_str or "No tracklist available."
+        else:
+            track_str = "No tracklist available."
+
+    if spotify_url:
+        link_url = spotify_url
+        if spotify_image:
+            thumb = spotify_image
+    else:
+        link_url = f"https://www.discogs.com/master/{master_id}"
+
+    artist_clean = clean_discogs_artist(artist_out)
+    title_header = f"[__**{title.upper()}**__]({link_url})"
+
+    description = (
+        f"{title_header}\n\n"
+        f"**Artist:** {artist_clean}\n"
+        f"**Year:** {year_out}\n"
+        f"**Genres:** {genres}\n"
+        f"**Styles:** {styles}\n\n"
+        f"**Tracklist:**\n{track_str}"
+    )
+
+    embed = discord.Embed(
+        description=description,
+        color=discord.Color.blue()
+    )
+    if thumb:
+        embed.set_image(url=thumb)
+
+    return master_id, embed
 
 # ======= COMMANDS =======
 
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.metrics_start = time.perf_counter()
+
+@bot.after_invoke
+async def record_command_time(ctx):
+    name = ctx.command.qualified_name
+    metrics_observe("command", name, time.perf_counter() - ctx.metrics_start)
+    if ctx.command_failed:
+        metrics_inc("command_error", name)
+
 @bot.command()
 async def teddy(ctx):
     await send_file(ctx, "teddy.jpg")
 
 @bot.command()
 async def motivation(ctx):
+    if not sosa_files:
+        await asyncio.shield(start_preloads())
+    if not sosa_files:
+        return
     file_path = random.choice(sosa_files)
     await send_file(ctx, file_path)
 
 @bot.command()
-async def mishpat(ctx):
-    with open("geo-list.txt", "r", encoding="utf-8") as f:
-        content = f.read()
-    entries = content.strip().split("\n\n")
-    theorem_entry = random.choice(entries)
-    lines = theorem_entry.strip().split("\n")
-    raw_id = lines[0].replace("ID:", "").strip("[] ").zfill(3)
+async def mishpat(ctx, theorem_id: str = None):
+    index = await get_theorem_index()
+    if not index:
+        await ctx.send("No theorems found.")
+        return
+    if theorem_id:
+        raw_id = theorem_id.strip("[] ").zfill(3)
+        if raw_id not in index:
+            await ctx.send(f"❌ No theorem with ID `{theorem_id}`.")
+            return
+    else:
+        raw_id = random.choice(theorem_ids)
     if raw_id == "123": # אם יוצא משפט פיתגורס
         embed = discord.Embed(
             title="[ 123 ]",
@@ -469,7 +2470,7 @@ async def mishpat(ctx):
         await ctx.send(embed=embed)
         return
     id_line = f"[ {raw_id} ]"
-    text = "\n".join(lines[1:])
+    text = index[raw_id]
     embed = discord.Embed(
         title=id_line,
         description=text,
@@ -479,7 +2480,7 @@ async def mishpat(ctx):
 
 @bot.command(name="crack", aliases=["cst"])
 async def crack(ctx, filter: str = None):
-    if not curator_reviews:
+    if not len(review_store):
         await ctx.send("No reviews found. Try again later.")
         return
     valid_filters = {
@@ -487,40 +2488,31 @@ async def crack(ctx, filter: str = None):
         "(not)": "❌ Not Recommended",
         "(info)": "🧠 Informational"
     }
-    filtered_reviews = curator_reviews
+    verdict = None
     if filter:
         filter = filter.lower()
         if filter in valid_filters:
-            filtered_reviews = [r for r in curator_reviews if r["verdict"] == valid_filters[filter]]
+            verdict = valid_filters[filter]
         else:
             await ctx.send("❌ Invalid filter. Use `(recommended)`, `(not)`, or `(info)`.")
             return
-    if not filtered_reviews:
+    selected = review_store.pick(verdict)
+    if not selected:
         await ctx.send("No matching reviews found.")
         return
-    selected = random.choice(filtered_reviews)
-    match = re.search(r'/app/(\d+)', selected["url"])
-    app_id = match.group(1) if match else ""
-    if "Not Recommended" in selected["verdict"]:
-        color = discord.Color.red()
-    elif "Recommended" in selected["verdict"]:
-        color = discord.Color.green()
-    else:
-        color = discord.Color.gold()
-    blurb = selected["blurb"].strip('"')
-    description = f"### {blurb}"
+    description = f"### {selected.text}"
     embed = discord.Embed(
-        title=selected["game"],
-        url=selected["url"],
+        title=selected.game,
+        url=selected.url,
         description=description,
-        color=color
+        color=discord.Color(selected.color)
     )
     embed.set_author(
-        name=selected["verdict"],
+        name=selected.verdict,
         icon_url="https://avatars.cloudflare.steamstatic.com/bd6df2273e04387f443475fd3217435c34da8e65_full.jpg"
     )
-    if app_id:
-        embed.set_image(url=f"https://cdn.cloudflare.steamstatic.com/steam/apps/{app_id}/header.jpg")
+    if selected.app_id:
+        embed.set_image(url=f"https://cdn.cloudflare.steamstatic.com/steam/apps/{selected.app_id}/header.jpg")
     await ctx.send(embed=embed)
 
 @bot.command(name="help_crack")
@@ -551,13 +2543,22 @@ async def help_crack(ctx):
     await ctx.send(embed=embed)
 
 @bot.command()
-async def update_reviews(ctx):
-    if ctx.author.id != 338054995209355274: # אם מישהו שהוא לא אני מנסה להשתמש בפקודה הזאת
+async def update_reviews(ctx, mode: str = ""):
+    if ctx.author.id != OWNER_ID: # אם מישהו שהוא לא אני מנסה להשתמש בפקודה הזאת
         await send_file(ctx, "stfu.mov")
         return
-    await ctx.send("🔄 Updating curator reviews...")
-    await fetch_and_save_curator_reviews()
-    await ctx.send(f"✅ Updated and saved {len(curator_reviews)} reviews.")
+    flight, joined = start_curator_sync(full=mode.lower() == "full")
+    status = await ctx.send("🔄 An update is already running, waiting for it..." if joined else "🔄 Updating curator reviews...")
+
+    async def show_progress(progress):
+        await status.edit(content=f"🔄 Updating curator reviews... {progress}")
+
+    try:
+        changed = await await_flight(flight, show_progress)
+    except asyncio.TimeoutError:
+        await ctx.send("❌ Steam took too long, the update was stopped.")
+        return
+    await ctx.send(f"✅ Updated and saved {len(review_store)} reviews ({changed} new or changed).")
 
 @bot.command()
 async def album(ctx, *, filters: str = ""): # הפקודה הזאת עברה כל כך הרבה גרסאות ביני ובין צ'אט שבאמת אין לי מושג מה עושה מה כבר
@@ -565,168 +2566,53 @@ async def album(ctx, *, filters: str = ""): # הפקודה הזאת עברה כ
         await ctx.send("❌ Missing Discogs API token.")
         return
 
-    looking_msg = await ctx.send("🔄 looking for album")
-
-    artist = style = year = None
-    match = re.search(r"\[(.*?)\]", filters)
-    attempts = []
-    if match:
-        parts = [p.strip() for p in match.group(1).split(',') if p.strip()]
-        for part in parts[:]:
-            if part.isdigit() and len(part) == 4:
-                year = part
-                parts.remove(part)
-        if len(parts) == 2:
-            attempts.append({'artist': parts[0], 'style': parts[1]})
-            attempts.append({'style': parts[0], 'artist': parts[1]})
-        elif len(parts) == 1:
-            attempts.append({'style': parts[0]})
-            attempts.append({'artist': parts[0]})
-    if (not attempts or not match) and year:
-        attempts.append({})
-    if not attempts:
-        attempts.append({})
-
-    # Fuzzy resolve artist names using Discogs
-    for attempt in attempts:
-        if 'artist' in attempt and attempt['artist']:
-            attempt['artist'] = await resolve_discogs_artist_name(attempt['artist'], DISCOGS_TOKEN)
-
-    params_base = []
-    if year: params_base.append(f"year={year}")
-    params_base.append("per_page=15")
-    params_base.append("type=master")
-    params_base.append(f"token={DISCOGS_TOKEN}")
-
-    found_result = None
-    master_id = None
-    master_data = None
-    thumb = None
-
-    session = await get_session()
-    for attempt in attempts:
-        params = params_base[:]
-        if 'artist' in attempt: params.append(f"artist={urllib.parse.quote(attempt['artist'])}")
-        if 'style' in attempt: params.append(f"style={urllib.parse.quote(attempt['style'])}")
-
-        url = f"https://api.discogs.com/database/search?{'&'.join(params)}"
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                continue
-            data = await resp.json()
-            results = data.get("results", [])
-            if not results:
-                continue
-            found_result = random.choice(results)
-            master_id = found_result.get("id")
-            master_data = found_result
-            thumb = found_result.get("cover_image")
-            break
+    embed = take_prefetched_album(filters)
+    if embed:
+        await ctx.send(embed=embed)
+        return
 
-    if not found_result or not master_id:
+    looking_msg = await ctx.send("🔄 looking for album")
+    attempts, year = parse_album_filters(filters)
+    try:
+        master_id, embed = await asyncio.wait_for(resolve_album(attempts, year), ALBUM_DEADLINE)
+    except asyncio.TimeoutError:
         await looking_msg.delete()
+        await ctx.send("❌ Discogs is taking too long, try again in a bit.")
+        return
+    await looking_msg.delete()
+    if not embed:
         await ctx.send("❌ No albums found for that filter.")
         return
+    await ctx.send(embed=embed)
 
-    details_url = f"https://api.discogs.com/masters/{master_id}"
-    artist_out = master_data.get("artist") or ""
-    year_out = master_data.get("year") or year or "Unknown Year"
-    genres = ", ".join(master_data.get("genre", []))
-    styles = ", ".join(master_data.get("style", []))
-    title = master_data.get("title", "Unknown Title")
-
-    split_match = re.match(r"(.+?)[–:-]\s+(.+)", title)
-    if split_match:
-        possible_artist, possible_album = split_match.groups()
-        if (not artist_out or re.search(r"\(\d+\)", artist_out) or artist_out.lower() in possible_artist.lower()):
-            artist_out = possible_artist.strip()
-            title = possible_album.strip()
-
-    spotify_url = None
-    spotify_image = None
-    spotify_tracklist = None
-    if SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET:
-        try:
-            token = await get_spotify_token(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET)
-            if token:
-                spotify_url, spotify_image, spotify_tracklist = await get_spotify_album_url(token, title, clean_discogs_artist(artist_out))
-        except Exception as e:
-            spotify_url = None
-            spotify_image = None
-            spotify_tracklist = None
-
-    track_str = ""
-    if spotify_tracklist:
-        track_str = "\n".join(spotify_tracklist)
-    else:
-        session2 = await get_session()
-        async with session2.get(details_url) as resp2:
-            if resp2.status == 200:
-                release_data = await resp2.json()
-                images = release_data.get("images")
-                if images and images[0].get("uri"):
-                    thumb = images[0]["uri"]
-                if "title" in release_data:
-                    title = release_data["title"]
-                if "artists" in release_data and release_data["artists"]:
-                    artist_out = ", ".join(a["name"] for a in release_data["artists"])
-                if "year" in release_data:
-                    year_out = release_data["year"]
-                if "genres" in release_data:
-                    genres = ", ".join(release_data["genres"])
-                if "styles" in release_data:
-                    styles = ", ".join(release_data["styles"])
-                discogs_tracklist = release_data.get("tracklist", [])
-                local_track_str = ""
-                if discogs_tracklist:
-                    for i, t in enumerate(discogs_tracklist, 1):
-                        name = t.get('title', '')
-                        if name:
-                            local_track_str += f"**{i}.** {name}\n"
-                if not local_track_str:
-                    main_release_id = release_data.get("main_release")
-                    if main_release_id:
-                        await asyncio.sleep(1.5)
-                        release_url = f"https://api.discogs.com/releases/{main_release_id}"
-                        async with session2.get(release_url) as rel_resp:
-                            if rel_resp.status == 200:
-                                rel_data = await rel_resp.json()
-                                rel_tracklist = rel_data.get("tracklist", [])
-                                for i, t in enumerate(rel_tracklist, 1):
-                                    name = t.get('title', '')
-                                    if name:
-                                        local_track_str += f"**{i}.** {name}\n"
-                track_str = local_track_str or "No tracklist available."
-            else:
-                track_str = "No tracklist available."
-
-    if spotify_url:
-        link_url = spotify_url
-        if spotify_image:
-            thumb = spotify_image
-    else:
-        link_url = f"https://www.discogs.com/master/{master_id}"
-
-    artist_clean = clean_discogs_artist(artist_out)
-    title_header = f"[__**{title.upper()}**__]({link_url})"
-
-    description = (
-        f"{title_header}\n\n"
-        f"**Artist:** {artist_clean}\n"
-        f"**Year:** {year_out}\n"
-        f"**Genres:** {genres}\n"
-        f"**Styles:** {styles}\n\n"
-        f"**Tracklist:**\n{track_str}"
-    )
-
-    embed = discord.Embed(
-        description=description,
-        color=discord.Color.blue()
-    )
-    if thumb:
-        embed.set_image(url=thumb)
+@bot.command()
+async def stats(ctx):
+    if ctx.author.id != OWNER_ID:
+        await send_file(ctx, "stfu.mov")
+        return
 
-    await looking_msg.delete()
+    def summary(kind, limit=10):
+        rows = sorted(((k[1], h) for k, h in metrics_histograms.items() if k[0] == kind), key=lambda r: -r[1][0])
+        lines = []
+        for name, hist in rows[:limit]:
+            avg = hist[1] / hist[0] * 1000
+            p99 = metrics_quantile(hist, 0.99)
+            p99_str = f"{p99 * 1000:.0f}ms" if p99 != float("inf") else f">{METRIC_BUCKETS[-1]}s"
+            lines.append(f"`{name}` n={hist[0]} avg={avg:.0f}ms p99≤{p99_str}")
+        return "\n".join(lines)[:1024] or "—"
+
+    embed = discord.Embed(title="📊 Stats", color=discord.Color.dark_teal())
+    embed.add_field(name="Handlers", value=summary("handler"), inline=False)
+    embed.add_field(name="Commands", value=summary("command"), inline=False)
+    embed.add_field(name="Triggers", value=summary("trigger"), inline=False)
+    embed.add_field(name="External endpoints", value=summary("http"), inline=False)
+    embed.add_field(name="Workers", value=summary("worker"), inline=False)
+    embed.add_field(name="Event loop lag", value=summary("loop"), inline=False)
+    embed.add_field(name="HTTP pool wait", value=summary("http_pool_wait"), inline=False)
+    counters = "\n".join(f"`{event}` {label} = {n}" for (event, label), n in sorted(metrics_counters.items()))
+    media = ", ".join(f"{k}={v}" for k, v in media_cache_stats.items())
+    embed.add_field(name="Counters", value=(counters or "—")[:1024], inline=False)
+    embed.add_field(name="Media cache", value=media, inline=False)
     await ctx.send(embed=embed)
 
 @bot.command(name="help_album")
@@ -760,7 +2646,7 @@ async def help(ctx):
     embed.add_field(name="`h2a album`", value="Write 'h2a help_album' for more info on the command", inline=False)
     embed.add_field(name="`h2a crack`", value="Write 'h2a help_crack' for more info on the command", inline=False)
     embed.add_field(name="`h2a teddy`", value="🐶", inline=False)
-    embed.add_field(name="`h2a mishpat`", value="180 (תכנית 141)", inline=False)
+    embed.add_field(name="`h2a mishpat`", value="180 (תכנית 141)\nWrite `h2a mishpat {ID}` for a specific one", inline=False)
     embed.add_field(name="`h2a motivation`", value="Sends a motivational picture of Chief Keef", inline=False)
     embed.add_field(name="`h2a help`", value="Shows this list of commands", inline=False)
     await ctx.send(embed=embed)
@@ -768,9 +2654,176 @@ async def help(ctx):
 # ======= Bot Run & Cleanup =======
 @atexit.register
 def cleanup():
-    global aiohttp_session
-    if aiohttp_session and not aiohttp_session.closed:
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(aiohttp_session.close())
+    # Only synchronous work here, the loop is gone by now. The HTTP session is closed in MikaBot.close
+    message_streaks.save(STREAK_SNAPSHOT_PATH)
+    shutdown_worker_pools()
+
+def run_cluster_launcher():
+    # Shards are dealt round-robin, cluster N gets shards N, N + CLUSTER_COUNT, ...
+    shard_count = int(SHARD_COUNT or CLUSTER_COUNT)
+    procs = []
+    for cluster_id in range(min(CLUSTER_COUNT, shard_count)):
+        env = dict(
+            os.environ,
+            CLUSTER_ID=str(cluster_id),
+            SHARD_COUNT=str(shard_count),
+            SHARD_IDS=",".join(str(s) for s in range(cluster_id, shard_count, CLUSTER_COUNT))
+        )
+        procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env))
+    try:
+        for proc in procs:
+            proc.wait()
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+# ======= Benchmarks =======
+# python Mika.py bench-triggers [messages] - הודעות לשנייה במנוע הטריגרים מול הלולאה הישנה (ריגקס לכל מילה), על קורפוס מעורב עברית/אנגלית
+BENCH_WORDS = ("hello what is up lol bro idk really tonight game new play ok yes no maybe send link pls "
+               "אחי מה קורה היום בערב נלך לשחק משחק חדש אני לא יודע כן אולי שלח לינק תודה").split()
+
+def bench_corpus(count, seed=1):
+    rng = random.Random(seed)
+    keywords = [k for keywords, _ in media_triggers + text_triggers for k in keywords]
+    corpus = []
+    for _ in range(count):
+        words = rng.choices(BENCH_WORDS, k=rng.randint(3, 25))
+        # About one message in ten carries a trigger somewhere in it, like a normal busy channel
+        if rng.random() < 0.1:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+        if rng.random() < 0.05:
+            words.append("https://tenor.com/view/" + rng.choice(BENCH_WORDS))
+        corpus.append(" ".join(words))
+    return corpus
+
+def match_trigger_per_word(triggers, text):
+    # The matcher before the compiled engine: a fresh \b...\b search for every keyword, first trigger in the list wins
+    for i, (keywords, _) in enumerate(triggers):
+        if any(re.search(rf'\b{re.escape(w)}\b', text, re.IGNORECASE) for w in keywords):
+            return i
+    return None
+
+def run_trigger_bench(count):
+    triggers = media_triggers + text_triggers
+    pattern = compile_triggers(triggers)
+    corpus = [clean_message_content(m.lower()) for m in bench_corpus(count)]
+    results = {"messages": count}
+    hits = {}
+    for name, match in (("before", lambda msg: match_trigger_per_word(triggers, msg)),
+                        ("after", lambda msg: match_trigger(pattern, msg))):
+        start = time.perf_counter()
+        hits[name] = [match(msg) for msg in corpus]
+        results[f"{name}_msg_per_s"] = round(count / (time.perf_counter() - start))
+    results["hits"] = sum(hit is not None for hit in hits["after"])
+    results["same_hits"] = hits["before"] == hits["after"]
+    print(json.dumps(results))
+
+# python Mika.py bench-parse [runs] [dir] - זמן פרסור וזיכרון שיא לכל סקרייפר על דפי HTML שמורים, עם כל backend שמותקן
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench")
+BENCH_PARSE_FIXTURES = [
+    ("wikipedia_gacha.html", parse_wikipedia_gacha_games),
+    ("fandom_gacha.html", parse_fandom_gacha_games),
+    ("fish.html", parse_fish_list),
+    ("curator_page.html", parse_curator_page)
+]
 
-bot.run(TOKEN)
+def run_parse_bench(runs, fixture_dir):
+    global HTML_PARSER
+    default_parser = HTML_PARSER
+    try:
+        for parser in dict.fromkeys((default_parser, "html.parser")):
+            HTML_PARSER = parser
+            for filename, parse in BENCH_PARSE_FIXTURES:
+                with open(os.path.join(fixture_dir, filename), "r", encoding="utf-8") as f:
+                    html = f.read()
+                items = len(parse(html))
+                times = []
+                for _ in range(runs):
+                    start = time.perf_counter()
+                    parse(html)
+                    times.append(time.perf_counter() - start)
+                # Peak memory gets its own run, tracemalloc slows the timed ones down too much
+                tracemalloc.start()
+                parse(html)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(json.dumps({
+                    "scraper": parse.__name__,
+                    "parser": parser,
+                    "html_kb": round(len(html.encode()) / 1024),
+                    "items": items,
+                    "parse_ms_p50": round(sorted(times)[len(times) // 2] * 1000, 2),
+                    "peak_kb": round(peak / 1024)
+                }))
+    finally:
+        HTML_PARSER = default_parser
+
+# python Mika.py bench-startup [runs] - מריץ תהליכים נקיים עם ובלי LAZY_IMPORTS ומודד כמה זמן לוקח עד שהבוט עונה.
+# ההתחברות לדיסקורד לא נמדדת: ההודעה הראשונה היא הודעה מזויפת שמפעילה טריגר טקסט
+def run_startup_bench_child():
+    import_ms = (time.perf_counter() - STARTED_AT) * 1000
+    atexit.unregister(cleanup)
+    timings = {}
+
+    async def reply(*args, **kwargs):
+        timings.setdefault("first_reply_ms", (time.perf_counter() - STARTED_AT) * 1000)
+
+    async def no_commands(message):
+        pass
+
+    async def first_reply():
+        # Commands need a logged-in bot, only the trigger path is measured
+        bot.process_commands = no_commands
+        author = types.SimpleNamespace(id=0, bot=False, mention="<@0>")
+        channel = types.SimpleNamespace(id=0, send=reply)
+        message = types.SimpleNamespace(author=author, channel=channel, content="נאפו", mentions=[], reference=None, reply=reply)
+        preloads = start_preloads()
+        await on_message(message)
+        await preloads
+        timings["preloads_ms"] = (time.perf_counter() - STARTED_AT) * 1000
+
+    asyncio.run(first_reply())
+    shutdown_worker_pools()
+    print(json.dumps({"import_ms": import_ms, **timings}))
+
+def run_startup_bench(runs):
+    for mode, label in (("0", "eager imports"), ("1", "lazy imports")):
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "bench-startup-child"],
+                                 env=dict(os.environ, LAZY_IMPORTS=mode), capture_output=True, text=True, check=True)
+            sample = json.loads(out.stdout.splitlines()[-1])
+            sample["process_ms"] = (time.perf_counter() - start) * 1000
+            samples.append(sample)
+        medians = {key: sorted(s[key] for s in samples)[len(samples) // 2] for key in samples[0]}
+        print(f"{label}: " + ", ".join(f"{key[:-3]} {value:.0f}ms" for key, value in medians.items()))
+
+# Importing the module (e.g. from a load-test harness) must not log in to Discord
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "ingest-discogs":
+        print(f"Indexed {build_discogs_index(sys.argv[2])} masters into {DISCOGS_INDEX_PATH}")
+    elif len(sys.argv) == 2 and sys.argv[1] == "build-media":
+        try:
+            with open(MEDIA_MANIFEST_PATH, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = {}
+        manifest = build_media_manifest(MEDIA_DIRS, previous)
+        print(f"Indexed {len(manifest)} files, {sum(1 for e in manifest.values() if e['variant'])} optimized variants")
+    elif len(sys.argv) in (2, 3) and sys.argv[1] == "bench-triggers":
+        run_trigger_bench(int(sys.argv[2]) if len(sys.argv) == 3 else 25000)
+    elif len(sys.argv) in (2, 3, 4) and sys.argv[1] == "bench-parse":
+        run_parse_bench(int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+                        sys.argv[3] if len(sys.argv) > 3 else os.path.join(BENCH_DIR, "fixtures"))
+    elif len(sys.argv) in (2, 3) and sys.argv[1] == "bench-startup":
+        run_startup_bench(int(sys.argv[2]) if len(sys.argv) == 3 else 10)
+    elif len(sys.argv) == 2 and sys.argv[1] == "bench-startup-child":
+        run_startup_bench_child()
+    elif CLUSTER_COUNT > 1 and not SHARD_IDS:
+        run_cluster_launcher()
+    else:
+        message_streaks.load(STREAK_SNAPSHOT_PATH)
+        bot.run(TOKEN)
@@ -0,0 +1,133 @@
+# Offline load test: python bench/load.py [--latency 0.08] [--p429 0.05] [--json out.json]
+# Runs Mika's handlers against bench/stubs.py and prints throughput, p50/p99 latency and peak RSS as JSON
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.stubs import ApiStub, FakeChannel, FakeContext, FakeMessage, FakeUser  # noqa: E402
+
+WORDS = ("hello what is up lol bro idk really tonight game new play ok yes no "
+         "אחי מה קורה היום בערב נלך לשחק משחק חדש אני לא יודע כן אולי").split()
+TRIGGER_WORDS = "wow noob stunna howard נאפו וואו".split()
+ALBUM_FILTERS = ["", "[Chief Keef]", "[Trap]", "[Chief Keef, 2012]", "[Trap, Chief Keef]"]
+
+
+def chat_line(rng, words):
+    line = rng.choices(WORDS, k=words)
+    # About one message in ten hits a trigger, like a normal busy channel
+    if rng.random() < 0.1:
+        line.insert(rng.randrange(words + 1), rng.choice(TRIGGER_WORDS))
+    return " ".join(line)
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+    return {"p50_ms": pick(0.50), "p99_ms": pick(0.99)}
+
+
+async def run_messages(Mika, name, messages):
+    latencies = []
+    started = time.perf_counter()
+    for message in messages:
+        start = time.perf_counter()
+        await Mika.on_message(message)
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    replies = sum(len(channel.sent) for channel in {id(m.channel): m.channel for m in messages}.values())
+    return {"scenario": name, "messages": len(messages), "replies": replies,
+            "throughput_per_s": round(len(messages) / elapsed), **percentiles(latencies)}
+
+
+async def run_albums(Mika, stub, count, rng):
+    latencies = []
+
+    async def one(ctx, filters):
+        start = time.perf_counter()
+        await Mika.album.callback(ctx, filters=filters)
+        latencies.append(time.perf_counter() - start)
+
+    channel = FakeChannel(1)
+    ctxs = [FakeContext(channel, FakeUser(rng.randrange(1000)), "h2a album") for _ in range(count)]
+    requests, throttled = stub.requests, stub.throttled
+    started = time.perf_counter()
+    await asyncio.gather(*(one(ctx, rng.choice(ALBUM_FILTERS)) for ctx in ctxs))
+    elapsed = time.perf_counter() - started
+    embeds = sum(1 for _, kwargs in channel.sent if kwargs.get("embed"))
+    return {"scenario": f"album_x{count}_concurrent", "commands": count, "embeds": embeds,
+            "throughput_per_s": round(count / elapsed, 2), **percentiles(latencies),
+            "stub_requests": stub.requests - requests, "stub_429s": stub.throttled - throttled}
+
+
+async def main(args):
+    stub = await ApiStub(latency=args.latency, p429=args.p429).start()
+    work_dir = tempfile.mkdtemp(prefix="mika-bench-")
+    os.chdir(work_dir)
+    os.environ.update(stub.env(), DISCOGS_TOKEN="bench", SPOTIFY_CLIENT_ID="bench", SPOTIFY_CLIENT_SECRET="bench",
+                      HTTP_CACHE_PATH=os.path.join(work_dir, "http_cache.sqlite3"),
+                      STREAK_SNAPSHOT_PATH=os.path.join(work_dir, "streaks.sqlite3"),
+                      DISCOGS_INDEX_PATH=os.path.join(work_dir, "discogs_index.sqlite3"))
+    Mika = importlib.import_module("Mika")
+    # Commands are driven through their callbacks below, plain chat never reaches the command parser
+    async def no_commands(message):
+        pass
+    Mika.bot.process_commands = no_commands
+    # Placeholder media, so the media triggers and the yap counter upload something
+    for _, filename in Mika.media_triggers + [(None, "yap.gif"), (None, "nkyss.mp4")]:
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename, "wb") as f:
+            f.write(os.urandom(16 * 1024))
+
+    rng = random.Random(args.seed)
+    results = []
+    spammer = FakeUser(42)
+    channel = FakeChannel(1)
+    results.append(await run_messages(Mika, "spam_burst_one_channel", [
+        FakeMessage(channel, spammer, chat_line(rng, 8)) for _ in range(args.burst)
+    ]))
+    channels = [FakeChannel(100 + i) for i in range(args.channels)]
+    users = [FakeUser(1000 + i) for i in range(30)]
+    results.append(await run_messages(Mika, f"mixed_language_{args.channels}_channels", [
+        FakeMessage(rng.choice(channels), rng.choice(users), chat_line(rng, rng.randint(3, 20)))
+        for _ in range(args.chat)
+    ]))
+    results.append(await run_albums(Mika, stub, args.albums, rng))
+
+    await Mika.close_http_session()
+    await stub.stop()
+    Mika.shutdown_worker_pools()
+    report = {
+        "results": results,
+        "stub": {"latency_s": args.latency, "p429": args.p429},
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+    print(json.dumps(report, indent=1))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test for Mika")
+    parser.add_argument("--latency", type=float, default=0.08, help="mean stub response time in seconds")
+    parser.add_argument("--p429", type=float, default=0.05, help="share of Discogs requests answered with 429")
+    parser.add_argument("--burst", type=int, default=5000, help="messages in the one-channel spam burst")
+    parser.add_argument("--chat", type=int, default=20000, help="messages in the mixed-language chat")
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--albums", type=int, default=20, help="concurrent h2a album calls")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    asyncio.run(main(args))
@@ -0,0 +1,292 @@
+# Stand-ins for Discord and the third-party APIs, so Mika can run offline (bench/load.py and tests/ use these)
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import time
+
+from aiohttp import web
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# ======= API Stub =======
+# מחזיר תשובות מוקלטות של Discogs, Spotify וסטים, עם לטנסי מוגדר והזרקת 429 כמו שדיסקוגס עושה כשנגמר הבאקט
+class ApiStub:
+    def __init__(self, latency=0.08, p429=0.05, curator_pages=4, seed=1):
+        self.latency = latency
+        self.p429 = p429
+        self.curator_pages = curator_pages
+        self.rng = random.Random(seed)
+        self.responses = json.loads(load_fixture("api_responses.json"))
+        self.curator_html = load_fixture("curator_page.html")
+        self.requests = 0
+        self.throttled = 0
+        self.aborted = 0  # requests the client hung up on before the answer was ready
+        self.runner = None
+        self.port = None
+
+    def env(self):
+        base = f"http://127.0.0.1:{self.port}"
+        return {
+            "DISCOGS_API": f"{base}/discogs",
+            "SPOTIFY_API": f"{base}/spotify",
+            "SPOTIFY_ACCOUNTS_API": f"{base}/accounts",
+            "STEAM_STORE_API": f"{base}/steam"
+        }
+
+    async def start(self, port=0):
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self.handle)
+        # handler_cancellation: a client that hangs up cancels the handler, which is how aborted requests get counted
+        self.runner = web.AppRunner(app, handler_cancellation=True)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        self.port = self.runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.latency:
+            try:
+                await asyncio.sleep(self.rng.expovariate(1 / self.latency))
+            except asyncio.CancelledError:
+                self.aborted += 1
+                raise
+        path = request.path
+        if path.startswith("/discogs"):
+            if self.rng.random() < self.p429:
+                self.throttled += 1
+                return web.Response(status=429, headers={"Retry-After": "1"})
+            headers = {"X-Discogs-Ratelimit": "60", "X-Discogs-Ratelimit-Remaining": "59"}
+            if path == "/discogs/database/search":
+                key = "discogs_artist_search" if request.query.get("type") == "artist" else "discogs_master_search"
+                return web.json_response(self.responses[key], headers=headers)
+            if path.startswith("/discogs/masters/") or path.startswith("/discogs/releases/"):
+                return web.json_response(self.responses["discogs_master"], headers=headers)
+        elif path == "/accounts/api/token":
+            return web.json_response(self.responses["spotify_token"])
+        elif path == "/spotify/v1/search":
+            return web.json_response(self.responses["spotify_search"])
+        elif path.startswith("/spotify/v1/albums/"):
+            return web.json_response(self.responses["spotify_album"])
+        elif path.startswith("/steam/curator/"):
+            # The recorded page is replayed for every page, shifted so each one holds different app IDs
+            start = int(request.query.get("start", 0))
+            if start // int(request.query.get("count", 100)) >= self.curator_pages:
+                return web.json_response({"success": 1, "results_html": ""})
+            html = re.sub(r'(data-ds-appid="|/app/)(\d+)', lambda m: f"{m.group(1)}{int(m.group(2)) + start * 1000}",
+                          self.curator_html)
+            return web.json_response({"success": 1, "results_html": html})
+        return web.Response(status=404)
+
+
+# ======= Discord Stub =======
+# גייטווי ו-REST מזויפים של דיסקורד: מספיק כדי ש-discord.py יתחבר, יקבל READY לכל שארד, יקבל הודעות וישלח תשובות.
+# Mika is pointed here with DISCORD_API and DISCORD_GATEWAY
+BOT_USER = {"id": "900000000000000001", "username": "Mika", "discriminator": "0", "global_name": None, "avatar": None, "bot": True}
+
+
+def discord_json(data):
+    # discord.py only decodes a body whose Content-Type is exactly application/json, without a charset
+    return web.Response(body=json.dumps(data).encode(), headers={"Content-Type": "application/json"})
+
+
+class DiscordStub:
+    def __init__(self, shard_count=1):
+        self.shard_count = shard_count
+        self.shards = {}  # shard_id -> open websocket
+        self.identified = []  # (shard_id, shard_count) in connect order
+        self.sent = []  # message payloads the bot posted, with channel_id and any uploaded files
+        self.sent_event = asyncio.Event()
+        self.ids = itertools.count(int(time.time() * 1000) << 22)
+        self.runner = None
+        self.port = None
+
+    def env(self):
+        return {
+            "DISCORD_API": f"http://127.0.0.1:{self.port}/api/v10",
+            "DISCORD_GATEWAY": f"ws://127.0.0.1:{self.port}/gateway"
+        }
+
+    async def start(self, port=0):
+        app = web.Application()
+        app.router.add_get("/gateway", self.gateway)
+        app.router.add_get("/api/v10/users/@me", self.current_user)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self.application)
+        app.router.add_get("/api/v10/gateway/bot", self.gateway_bot)
+        app.router.add_post("/api/v10/channels/{channel_id}/messages", self.create_message)
+        app.router.add_delete("/api/v10/channels/{channel_id}/messages/{message_id}", self.delete_message)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        self.port = self.runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        for ws in list(self.shards.values()):
+            await ws.close()
+        await self.runner.cleanup()
+
+    async def current_user(self, request):
+        return discord_json(BOT_USER)
+
+    async def delete_message(self, request):
+        return web.Response(status=204)
+
+    async def application(self, request):
+        return discord_json({
+            "id": BOT_USER["id"], "name": "Mika", "description": "", "icon": None, "bot_public": False,
+            "bot_require_code_grant": False, "owner": dict(BOT_USER, id="1", bot=False), "verify_key": "0" * 64, "flags": 0
+        })
+
+    async def gateway_bot(self, request):
+        return discord_json({
+            "url": self.env()["DISCORD_GATEWAY"], "shards": self.shard_count,
+            "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 1}
+        })
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({"op": 10, "d": {"heartbeat_interval": 41250}})
+        shard_id = None
+        async for msg in ws:
+            payload = json.loads(msg.data)
+            if payload["op"] == 1:
+                await ws.send_json({"op": 11})
+            elif payload["op"] == 2:
+                shard_id, shard_count = payload["d"].get("shard") or (0, 1)
+                self.shards[shard_id] = ws
+                self.identified.append((shard_id, shard_count))
+                await ws.send_json({"op": 0, "t": "READY", "s": 1, "d": {
+                    "v": 10, "user": BOT_USER, "guilds": [], "session_id": f"session-{shard_id}",
+                    "resume_gateway_url": self.env()["DISCORD_GATEWAY"], "shard": [shard_id, shard_count],
+                    "application": {"id": BOT_USER["id"], "flags": 0}
+                }})
+        if shard_id is not None and self.shards.get(shard_id) is ws:
+            del self.shards[shard_id]
+        return ws
+
+    def guild_for_shard(self, shard_id):
+        # Discord routes a guild to shard (guild_id >> 22) % shard_count
+        return ((next(self.ids) >> 22) * self.shard_count + shard_id) << 22
+
+    async def send_message(self, shard_id, channel_id, author_id, content):
+        ws = self.shards[shard_id]
+        guild_id = self.guild_for_shard(shard_id)
+        await ws.send_json({"op": 0, "t": "MESSAGE_CREATE", "s": 2, "d": {
+            "id": str(next(self.ids)), "channel_id": str(channel_id), "guild_id": str(guild_id),
+            "author": {"id": str(author_id), "username": f"user{author_id}", "discriminator": "0", "global_name": None, "avatar": None},
+            "content": content, "timestamp": "2026-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False,
+            "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+            "pinned": False, "type": 0
+        }})
+
+    async def create_message(self, request):
+        channel_id = request.match_info["channel_id"]
+        files = []
+        if request.content_type.startswith("multipart/"):
+            payload = {}
+            async for part in await request.multipart():
+                if part.name == "payload_json":
+                    payload = json.loads(await part.text())
+                else:
+                    files.append((part.filename, await part.read()))
+        else:
+            payload = await request.json()
+        message_id = str(next(self.ids))
+        # CDN links carry their expiry as hex in ex=, the way Discord signs attachment URLs
+        expires = format(int(time.time()) + 24 * 3600, "x")
+        attachments = [{
+            "id": str(next(self.ids)), "filename": name, "size": len(data),
+            "url": f"https://cdn.discordapp.com/attachments/{channel_id}/{message_id}/{name}?ex={expires}&is=0&hm=0",
+            "proxy_url": f"https://media.discordapp.net/attachments/{channel_id}/{message_id}/{name}?ex={expires}&is=0&hm=0"
+        } for name, data in files]
+        self.sent.append(dict(payload, channel_id=channel_id, files=files))
+        self.sent_event.set()
+        return discord_json({
+            "id": message_id, "channel_id": channel_id, "author": BOT_USER, "content": payload.get("content") or "",
+            "timestamp": "2026-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False, "mention_everyone": False,
+            "mentions": [], "mention_roles": [], "attachments": attachments, "embeds": payload.get("embeds") or [],
+            "pinned": False, "type": 0
+        })
+
+    async def wait_for_sent(self, check, timeout=20):
+        # Waits until the bot has posted a message matching check(payload)
+        deadline = time.monotonic() + timeout
+        while True:
+            for payload in self.sent:
+                if check(payload):
+                    return payload
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.sent_event.clear()
+            try:
+                await asyncio.wait_for(self.sent_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+# ======= Fake Discord Objects =======
+# מספיק ממשק כדי להזין את on_message ואת הקולבקים של הפקודות ישירות, בלי טוקן ובלי גייטווי
+class FakeUser:
+    def __init__(self, id, bot=False):
+        self.id = id
+        self.bot = bot
+        self.mention = f"<@{id}>"
+        self.name = f"user{id}"
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content, mentions=(), reference=None, attachments=()):
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.mentions = list(mentions)
+        self.reference = reference
+        self.attachments = list(attachments)
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content, reference=self, **kwargs)
+
+    async def delete(self):
+        self.channel.deleted.append(self)
+
+    async def edit(self, content=None, **kwargs):
+        self.content = content
+
+
+class FakeChannel:
+    def __init__(self, id):
+        self.id = id
+        self.sent = []
+        self.deleted = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append((content, kwargs))
+        return FakeMessage(self, FakeUser(0, bot=True), content)
+
+
+class FakeContext:
+    def __init__(self, channel, author, content=""):
+        self.channel = channel
+        self.author = author
+        self.message = FakeMessage(channel, author, content)
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    async def reply(self, content=None, **kwargs):
+        return await self.message.reply(content, **kwargs)
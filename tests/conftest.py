@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+# Mika reads its paths from the environment at import time, so everything it writes goes to a scratch directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="mika-tests-")
+sys.path.insert(0, ROOT)
+os.environ.update(
+    HTTP_CACHE_PATH=os.path.join(WORK_DIR, "http_cache.sqlite3"),
+    STREAK_SNAPSHOT_PATH=os.path.join(WORK_DIR, "streaks.sqlite3"),
+    WARMUP_SNAPSHOT_PATH=os.path.join(WORK_DIR, "warmup_snapshot.json"),
+    DISCOGS_INDEX_PATH=os.path.join(WORK_DIR, "discogs_index.sqlite3"),
+    ARTIST_DICT_PATH=os.path.join(WORK_DIR, "artists.jsonl"),
+    MEDIA_LINKS_PATH=os.path.join(WORK_DIR, "media_links.json"),
+    MEDIA_CACHE_DIR=os.path.join(WORK_DIR, "media_cache"),
+    METRICS_PATH=os.path.join(WORK_DIR, "metrics.prom"),
+)
+os.chdir(WORK_DIR)
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+import Mika
+
+
+@pytest.fixture
+def discogs(tmp_path, monkeypatch):
+    dictionary = Mika.ArtistDictionary(str(tmp_path / "artists.jsonl"))
+    dictionary._add("Future", 1)
+    dictionary._add("Drake", 2)
+    dictionary._add("Chief Keef", 3)
+    monkeypatch.setattr(Mika, "artist_dictionary", dictionary)
+    state = {"calls": [], "status": 200, "results": []}
+
+    async def fake_get_json(url, headers=None, priority=None):
+        state["calls"].append(url)
+        return state["status"], {"results": state["results"]}
+
+    monkeypatch.setattr(Mika, "cached_get_json", fake_get_json)
+    return state
+
+
+def resolve(name):
+    return asyncio.run(Mika.resolve_discogs_artist_name(name, "token"))
+
+
+def test_close_dictionary_name_does_not_shadow_discogs(discogs):
+    discogs["results"] = [{"title": "Futures", "id": 10}, {"title": "Future", "id": 1}]
+    assert resolve("Futures") == "Futures"
+    discogs["results"] = [{"title": "Drake", "id": 2}, {"title": "Drakeo", "id": 11}]
+    assert resolve("Drakeo") == "Drakeo"
+    assert len(discogs["calls"]) == 2
+
+
+def test_fuzzy_hint_is_the_fallback_and_never_an_alias(discogs):
+    discogs["status"] = 429
+    assert resolve("Chif Keef") == "Chief Keef"
+    assert Mika.artist_dictionary.lookup("Chif Keef") is None
+    assert resolve("Nobody Like This") == "Nobody Like This"
+
+
+def test_exact_alias_answers_locally(discogs):
+    discogs["results"] = [{"title": "Chief Keef", "id": 3}]
+    assert resolve("chief keef") == "Chief Keef"
+    calls = len(discogs["calls"])
+    assert resolve("Chief  Keef") == "Chief Keef"
+    assert len(discogs["calls"]) == calls
+
+
+def test_numbered_discogs_title_does_not_answer_the_plain_name(discogs, tmp_path, monkeypatch):
+    monkeypatch.setattr(Mika, "artist_dictionary", Mika.ArtistDictionary(str(tmp_path / "empty.jsonl")))
+    discogs["results"] = [{"title": "Future Islands", "id": 20}, {"title": "Future (4)", "id": 21}]
+    assert resolve("Future Islands") == "Future Islands"
+    discogs["results"] = [{"title": "Future", "id": 1}]
+    assert resolve("Future") == "Future"
+    assert len(discogs["calls"]) == 2
+    assert Mika.artist_dictionary.lookup("Future (4)") == "Future (4)"
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import signal
+import sys
+
+from bench.stubs import ApiStub, DiscordStub
+
+import Mika
+
+MIKA_PATH = os.path.abspath(Mika.__file__)
+LEADER_SHARD, FOLLOWER_SHARD = 0, 1
+
+
+async def run_clusters(work_dir):
+    api = await ApiStub(latency=0.01, p429=0, curator_pages=2).start()
+    gateway = await DiscordStub(shard_count=2).start()
+    env = dict(os.environ, **api.env(), **gateway.env(), DISCORD_TOKEN="stub", CLUSTER_COUNT="2", SHARD_COUNT="2",
+               SHARED_STATE_POLL="1")
+    # Every path relative to the work dir, so both clusters share one set of files like a real deployment
+    for name in ("HTTP_CACHE_PATH", "STREAK_SNAPSHOT_PATH", "WARMUP_SNAPSHOT_PATH", "DISCOGS_INDEX_PATH",
+                 "ARTIST_DICT_PATH", "MEDIA_LINKS_PATH", "MEDIA_CACHE_DIR", "METRICS_PATH"):
+        env.pop(name, None)
+    launcher = await asyncio.create_subprocess_exec(sys.executable, MIKA_PATH, cwd=work_dir, env=env)
+    try:
+        for _ in range(300):
+            if len(gateway.shards) == 2:
+                break
+            await asyncio.sleep(0.1)
+        assert sorted(gateway.identified) == [(0, 2), (1, 2)]
+
+        # Each cluster answers the messages of its own shard
+        for shard_id in (LEADER_SHARD, FOLLOWER_SHARD):
+            await gateway.send_message(shard_id, 500 + shard_id, 42, "נאפו")
+        for shard_id in (LEADER_SHARD, FOLLOWER_SHARD):
+            reply = await gateway.wait_for_sent(lambda p: p["channel_id"] == str(500 + shard_id))
+            assert reply and reply["content"] == "בנאפו?! מי מציג בנאפו??"
+
+        # The leader syncs curator reviews, the follower picks them up from the shared store
+        await gateway.send_message(FOLLOWER_SHARD, 601, Mika.OWNER_ID, "h2a crack")
+        empty = await gateway.wait_for_sent(lambda p: p["channel_id"] == "601")
+        assert empty and empty["content"] == "No reviews found. Try again later."
+        await gateway.send_message(LEADER_SHARD, 600, Mika.OWNER_ID, "h2a update_reviews full")
+        synced = await gateway.wait_for_sent(lambda p: p["channel_id"] == "600" and (p.get("content") or "").startswith("✅"))
+        assert synced and "200 reviews" in synced["content"]
+        crack = None
+        for attempt in range(10):
+            await gateway.send_message(FOLLOWER_SHARD, 602 + attempt, Mika.OWNER_ID, "h2a crack")
+            crack = await gateway.wait_for_sent(lambda p: p["channel_id"] == str(602 + attempt))
+            if crack and crack.get("embeds"):
+                break
+            await asyncio.sleep(0.5)
+        assert crack and crack["embeds"][0]["url"].startswith("https://store.steampowered.com/app/")
+    finally:
+        if launcher.returncode is None:
+            launcher.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(launcher.wait(), 15)
+        except asyncio.TimeoutError:
+            launcher.kill()
+        await gateway.stop()
+        await api.stop()
+
+
+def test_two_clusters_against_the_stubbed_gateway(tmp_path):
+    asyncio.run(run_clusters(str(tmp_path)))
@@ -0,0 +1,50 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+import Mika
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "discogs_masters.xml")
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    # The gzipped copy goes through the same path as a real monthly dump
+    dump = str(tmp_path / "discogs_masters.xml.gz")
+    with open(FIXTURE, "rb") as src, gzip.open(dump, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    path = str(tmp_path / "discogs_index.sqlite3")
+    assert Mika.build_discogs_index(dump, path) == 8
+    monkeypatch.setattr(Mika, "DISCOGS_INDEX_PATH", path)
+    return path
+
+
+def pick_all(attempt, year=None, tries=200):
+    return {m["id"]: m for m in (Mika.pick_local_master(attempt, year) for _ in range(tries)) if m}
+
+
+def test_pick_by_artist_normalizes_names(index):
+    assert set(pick_all({"artist": "beatles"})) == {24047, 24003}
+    assert set(pick_all({"artist": "Lil Reese"})) == {614214}
+    assert set(pick_all({"artist": "!!!"})) == {1093}
+
+
+def test_pick_matches_style_against_genres_and_styles(index):
+    assert set(pick_all({"style": "Drill"})) == {614214, 741129}
+    assert set(pick_all({"style": "jazz"})) == {33064}
+    assert set(pick_all({"style": "Trap", "artist": "Chief Keef"}, year=2012)) == {557373}
+    assert Mika.pick_local_master({"style": "Trap"}, 1999) is None
+
+
+def test_pick_looks_like_a_search_result(index):
+    bang = pick_all({"artist": "Lil Reese"})[614214]
+    assert bang["title"] == "Chief Keef & Lil Reese (2) - Bang"
+    assert bang["year"] == 2011
+    assert bang["genre"] == ["Hip Hop"] and bang["style"] == ["Trap", "Drill"]
+    assert pick_all({"style": "Techno"})[99001]["year"] is None
+
+
+def test_unfiltered_pick_covers_the_whole_catalogue(index):
+    assert len(pick_all({}, tries=400)) == 8
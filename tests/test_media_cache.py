@@ -0,0 +1,35 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+import Mika
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(Mika, "media_cache", OrderedDict())
+    monkeypatch.setattr(Mika, "media_cache_bytes", 0)
+    return Mika.media_cache
+
+
+def test_concurrent_misses_count_the_file_once(cache, tmp_path):
+    path = tmp_path / "yap.gif"
+    path.write_bytes(b"x" * 1000)
+
+    async def main():
+        await asyncio.gather(*(Mika.media_file(str(path)) for _ in range(5)))
+
+    asyncio.run(main())
+    assert list(cache) == [str(path)]
+    assert Mika.media_cache_bytes == 1000
+
+
+def test_changed_file_replaces_its_entry(cache, tmp_path):
+    path = tmp_path / "yap.gif"
+    path.write_bytes(b"x" * 1000)
+    asyncio.run(Mika.media_file(str(path)))
+    path.write_bytes(b"y" * 300)
+    asyncio.run(Mika.media_file(str(path)))
+    assert Mika.media_cache_bytes == 300
+    assert cache[str(path)][2] == b"y" * 300
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import discord
+import pytest
+
+import Mika
+from bench.stubs import DiscordStub
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    monkeypatch.setattr(Mika, "media_links", {})
+    monkeypatch.setattr(Mika, "media_hashes", {})
+    monkeypatch.setattr(Mika, "MEDIA_LINKS_PATH", str(tmp_path / "media_links.json"))
+    path = tmp_path / "wow.png"
+    path.write_bytes(b"\x89PNG" + b"a" * 2048)
+    return str(path)
+
+
+def run_against_stub(monkeypatch, scenario):
+    # A real discord.py client posts to the stub, so the uploads and the returned CDN links go through the actual HTTP layer
+    async def main():
+        stub = await DiscordStub().start()
+        monkeypatch.setattr(discord.http.Route, "BASE", stub.env()["DISCORD_API"])
+        client = discord.Client(intents=discord.Intents.none())
+        await client.login("stub-token")
+        try:
+            await scenario(stub, client.get_partial_messageable(1234))
+        finally:
+            await client.close()
+            await stub.stop()
+    asyncio.run(main())
+
+
+def uploads(stub):
+    return [payload for payload in stub.sent if payload["files"]]
+
+
+def test_second_send_reuses_the_uploaded_link(media, monkeypatch):
+    async def scenario(stub, channel):
+        await Mika.send_file(channel, media)
+        await Mika.send_file(channel, media)
+        assert len(uploads(stub)) == 1
+        first, second = stub.sent
+        assert first["files"][0][0] == "wow.png"
+        assert second["content"].startswith("https://cdn.discordapp.com/attachments/1234/")
+        assert not second["files"]
+
+    run_against_stub(monkeypatch, scenario)
+
+
+def test_changed_file_is_uploaded_again(media, monkeypatch):
+    async def scenario(stub, channel):
+        await Mika.send_file(channel, media)
+        with open(media, "wb") as f:
+            f.write(b"\x89PNG" + b"b" * 4096)
+        await Mika.send_file(channel, media)
+        assert len(uploads(stub)) == 2
+        assert len(Mika.media_links) == 2
+
+    run_against_stub(monkeypatch, scenario)
+
+
+def test_link_close_to_expiry_is_uploaded_again(media, monkeypatch):
+    async def scenario(stub, channel):
+        await Mika.send_file(channel, media)
+        (digest, (url, _)), = Mika.media_links.items()
+        Mika.media_links[digest] = (url, time.time() + Mika.MEDIA_LINK_MARGIN / 2)
+        await Mika.send_file(channel, media)
+        assert len(uploads(stub)) == 2
+        assert Mika.media_links[digest][0] != url
+
+    run_against_stub(monkeypatch, scenario)
+
+
+def test_links_survive_a_restart(media, monkeypatch):
+    async def scenario(stub, channel):
+        await Mika.send_file(channel, media)
+        saved = dict(Mika.media_links)
+        Mika.media_links = {}
+        Mika.media_hashes.clear()
+        await Mika.load_media_links()
+        assert Mika.media_links == saved
+        await Mika.send_file(channel, media)
+        assert len(uploads(stub)) == 1
+
+    run_against_stub(monkeypatch, scenario)
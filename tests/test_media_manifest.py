@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+import Mika
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    cache = tmp_path / "media_cache"
+    monkeypatch.setattr(Mika, "MEDIA_CACHE_DIR", str(cache))
+    monkeypatch.setattr(Mika, "MEDIA_MANIFEST_PATH", str(cache / "manifest.json"))
+    media = tmp_path / "media"
+    media.mkdir()
+    (media / "clip.mp4").write_bytes(b"\x00" * 64)
+    return cache, media
+
+
+def test_cleanup_removes_only_stale_variants(cache_dir):
+    cache, media = cache_dir
+    cache.mkdir()
+    stale = cache / "0123456789abcdef.jpg"
+    stale.write_bytes(b"old")
+    other_build = cache / "fedcba9876543210.png.tmp"
+    other_build.write_bytes(b"half written")
+    (cache / "thumbs").mkdir()
+    (cache / "notes.txt").write_text("keep")
+
+    manifest = Mika.build_media_manifest([str(media)], {})
+
+    assert list(manifest) == [Mika.media_key(str(media / "clip.mp4"))]
+    assert not stale.exists()
+    assert other_build.exists()
+    assert (cache / "thumbs").is_dir()
+    assert (cache / "notes.txt").exists()
+    assert os.path.exists(Mika.MEDIA_MANIFEST_PATH)
+
+
+def test_cleanup_keeps_variants_still_in_use(cache_dir):
+    cache, media = cache_dir
+    cache.mkdir()
+    kept = cache / "0123456789abcdef.jpg"
+    kept.write_bytes(b"variant")
+    key = Mika.media_key(str(media / "clip.mp4"))
+    st = os.stat(key)
+    previous = {key: {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": "0123456789abcdef" + "0" * 48,
+                      "width": None, "height": None, "variant": str(kept), "variant_size": 7}}
+
+    manifest = Mika.build_media_manifest([str(media)], previous)
+
+    assert manifest[key]["variant"] == str(kept)
+    assert kept.exists()
@@ -0,0 +1,26 @@
+from bench.stubs import FakeChannel, FakeMessage, FakeUser
+
+import Mika
+
+SNAKE, DINO, WALTER, GACHA = 168329788325363712, 201051167084642304, 343667951959932940, 280755361596702721
+
+
+def match(*mentions, content="hi", reference=None):
+    message = FakeMessage(FakeChannel(1), FakeUser(7), content, mentions=[FakeUser(m) for m in mentions], reference=reference)
+    rule = Mika.match_mention_rule(message, content)
+    return rule.name if rule else None
+
+
+def test_first_mention_wins_among_snake_dino_walter():
+    assert match(WALTER, SNAKE) == "walter"
+    assert match(SNAKE, WALTER) == "snake"
+    assert match(DINO, WALTER, SNAKE) == "dino"
+
+
+def test_snake_tier_beats_later_rules_regardless_of_order():
+    assert match(GACHA, WALTER, content="goon") == "walter"
+    assert match(GACHA, content="goon") == "gacha"
+
+
+def test_replies_skip_the_snake_tier():
+    assert match(WALTER, SNAKE, reference=object()) is None
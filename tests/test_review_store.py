@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+import Mika
+
+
+def write_reviews(path, count):
+    verdicts = ["✅ Recommended", "❌ Not Recommended", "🧠 Informational"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"game": f"Game {i}", "blurb": "b", "verdict": verdicts[i % 3],
+                                "url": f"https://store.steampowered.com/app/{i}"}) + "\n")
+
+
+def test_reload_never_exposes_a_partial_store(tmp_path):
+    path = str(tmp_path / "curator_reviews.jsonl")
+    write_reviews(path, 2000)
+    store = Mika.ReviewStore(path)
+
+    async def scenario():
+        await store.load()
+        seen = []
+        done = False
+
+        async def probe():
+            while not done:
+                seen.append(len(store))
+                assert store.pick() is not None
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(probe())
+        for _ in range(5):
+            await store.load()
+        done = True
+        await task
+        return seen
+
+    seen = asyncio.run(scenario())
+    assert seen and set(seen) == {2000}
+
+
+def test_half_written_line_is_skipped(tmp_path):
+    path = str(tmp_path / "curator_reviews.jsonl")
+    write_reviews(path, 10)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"game": "Game 10", "blu')
+    store = Mika.ReviewStore(path)
+    asyncio.run(store.load())
+    assert len(store) == 10
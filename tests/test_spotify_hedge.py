@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+import Mika
+from bench.stubs import ApiStub
+
+
+def test_losing_hedged_searches_are_aborted(monkeypatch):
+    async def main():
+        # Slow enough that every variant is in flight before the first one answers
+        stub = await ApiStub(latency=0.5, p429=0, seed=3).start()
+        monkeypatch.setattr(Mika, "SPOTIFY_API", stub.env()["SPOTIFY_API"])
+        monkeypatch.setattr(Mika, "SPOTIFY_HEDGE_DELAY", 0.01)
+        monkeypatch.setitem(Mika.spotify_token, "access_token", "stub")
+        monkeypatch.setitem(Mika.spotify_token, "expires_at", time.monotonic() + 3600)
+        try:
+            url, _, _ = await Mika.get_spotify_album_url("Finally Rich (Deluxe)", "Chief Keef (2)")
+            searches = stub.requests - 1  # the album details request is the last one
+            await asyncio.sleep(0.2)  # the stub notices the hung-up connections
+            assert url
+            assert searches == 5
+            assert stub.aborted >= 1
+            assert not Mika.flights
+        finally:
+            await Mika.close_http_session()
+            await stub.stop()
+
+    asyncio.run(main())
+
+
+def test_flight_keeps_running_while_someone_still_waits():
+    async def main():
+        calls = []
+
+        async def job(flight):
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        quitter = asyncio.create_task(Mika.single_flight(("test", 1), job))
+        stayer = asyncio.create_task(Mika.single_flight(("test", 1), job))
+        await asyncio.sleep(0)
+        quitter.cancel()
+        assert await stayer == "done"
+        assert calls == [1]
+        assert not Mika.flights
+
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+import pytest
+
+import Mika
+
+
+@pytest.fixture
+def token_server(monkeypatch):
+    state = {"fetches": 0, "fail": False}
+
+    async def fake_fetch(client_id, client_secret):
+        state["fetches"] += 1
+        if state["fail"]:
+            raise OSError("accounts.spotify.com is down")
+        return f"token-{state['fetches']}", 0.5
+
+    monkeypatch.setattr(Mika, "fetch_spotify_token", fake_fetch)
+    monkeypatch.setattr(Mika, "SPOTIFY_TOKEN_EXPIRY_MARGIN", 0)
+    monkeypatch.setattr(Mika, "SPOTIFY_TOKEN_REFRESH_AHEAD", 0.3)
+    monkeypatch.setattr(Mika, "SPOTIFY_TOKEN_RETRY", 0.05)
+    monkeypatch.setattr(Mika, "spotify_token", {"access_token": None, "expires_at": 0})
+    monkeypatch.setattr(Mika, "spotify_token_refresh", None)
+    monkeypatch.setattr(Mika, "spotify_token_timer", None)
+    return state
+
+
+def test_token_is_refreshed_before_it_expires_without_a_command(token_server):
+    async def main():
+        assert await Mika.get_spotify_token() == "token-1"
+        await asyncio.sleep(0.35)  # idle, nobody asks for the token
+        assert token_server["fetches"] == 2
+        assert Mika.spotify_token["expires_at"] - time.monotonic() > 0.3
+        assert await Mika.get_spotify_token() == "token-2"
+        Mika.spotify_token_timer.cancel()
+
+    asyncio.run(main())
+
+
+def test_failed_refresh_retries_while_the_old_token_still_works(token_server):
+    async def main():
+        await Mika.get_spotify_token()
+        token_server["fail"] = True
+        await asyncio.sleep(0.3)
+        assert token_server["fetches"] >= 3
+        assert await Mika.get_spotify_token() == "token-1"
+        Mika.spotify_token_timer.cancel()
+
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+import random
+import tracemalloc
+
+import Mika
+
+
+def record_messages(tracker, channels, count, rng, start=0.0):
+    for i in range(count):
+        tracker.record(rng.randrange(channels), rng.randrange(50), now=start + i * 0.001)
+
+
+def test_memory_stays_flat_with_many_channels():
+    tracker = Mika.StreakTracker(max_channels=2000, ttl=3600)
+    rng = random.Random(1)
+    tracemalloc.start()
+    try:
+        record_messages(tracker, 1_000_000, 20_000, rng)
+        filled = tracemalloc.get_traced_memory()[0]
+        # Ten times the messages over the same million channel IDs, all past the cap
+        record_messages(tracker, 1_000_000, 200_000, rng, start=20.0)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert len(tracker) == 2000
+    assert len(tracker.dirty) <= 2000
+    assert after - filled < 256 * 1024
+
+
+def test_idle_channels_expire():
+    tracker = Mika.StreakTracker(max_channels=100, ttl=60)
+    for channel_id in range(50):
+        tracker.record(channel_id, 1, now=0)
+    tracker.record(999, 1, now=120)
+    assert len(tracker) == 1
+    assert tracker.dirty == {999}
+
+
+def test_streaks_survive_a_restart(tmp_path):
+    path = str(tmp_path / "streaks.sqlite3")
+    tracker = Mika.StreakTracker(max_channels=100, ttl=3600)
+    for _ in range(4):
+        tracker.record(1, 7)
+    tracker.record(2, 8)
+    tracker.save(path)
+
+    restored = Mika.StreakTracker(max_channels=100, ttl=3600)
+    restored.load(path)
+    assert restored.record(1, 7) == 5
+    assert restored.record(2, 9) == 1